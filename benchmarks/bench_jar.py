@@ -0,0 +1,192 @@
+"""Benchmark jar construction, rendering, saving and the docker round trips.
+
+Synthetic jars with many helpers, constants and deep inheritance chains are
+generated into a temporary module and timed against the in-process fake docker
+client of the test suite, so only mason's own overhead is measured.
+
+Timings are divided by a fixed pure python calibration workload, which keeps
+them comparable across machines. With `--check` the script exits non-zero when
+any of them regresses beyond `--threshold` times the committed baseline (and
+above a small noise floor):
+
+    python benchmarks/bench_jar.py --check benchmarks/baseline.json
+    python benchmarks/bench_jar.py --save benchmarks/baseline.json
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import *
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+import mason  # noqa: E402
+from fake_docker import FakeDockerClient  # noqa: E402
+
+# regressions smaller than this (in calibration units) are treated as noise
+NOISE_FLOOR = 0.01
+
+# (helpers, constants, inheritance depth)
+CASES = [
+    (10, 10, 1),
+    (100, 100, 1),
+    (1000, 1000, 1),
+    (5000, 5000, 1),
+    (100, 100, 10),
+    (100, 100, 50),
+]
+QUICK_CASES = CASES[:2] + CASES[4:5]
+
+
+def _jar_source(helpers: int, constants: int, depth: int) -> str:
+    """Module source of a chain of `depth` jar classes sharing out `helpers`;
+    the leaf class defines all `constants`."""
+    lines = ["import mason", ""]
+    per_level = -(-helpers // depth)
+    for level in range(depth):
+        parent = f"Jar{level - 1}" if level else "mason.Jar"
+        lines += [f"class Jar{level}({parent}):", "    base_image = 'python:3.8'", ""]
+        lines += ["    def setup_image(self):"]
+        if level:
+            lines += ["        super().setup_image()"]
+        lines += [f"        self.RUN('echo {level}')", ""]
+        for i in range(level * per_level, min((level + 1) * per_level, helpers)):
+            lines += [
+                "    @mason.include",
+                f"    def helper_{i}(self, x):",
+                "        import math  # frontmatter",
+                f"        return x + {i}",
+                "",
+            ]
+    lines += ["    def constants(self):"]
+    lines += [f"        self.c_{i} = {i}" for i in range(constants)] or ["        pass"]
+    lines += [
+        "",
+        "    def entrypoint(self, x: int):",
+        "        print(helper_0(x))",
+        "",
+    ]
+    return "\n".join(lines)
+
+
+def _load_jar(folder: str, helpers: int, constants: int, depth: int) -> type:
+    name = f"synthetic_{helpers}_{constants}_{depth}"
+    path = os.path.join(folder, f"{name}.py")
+    with open(path, "w") as f:
+        f.write(_jar_source(helpers, constants, depth))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, f"Jar{depth - 1}")
+
+
+def _calibrate(repeat: int) -> float:
+    def workload():
+        d = {}
+        for i in range(200_000):
+            d[str(i)] = i * 2
+        return sorted(d.items())
+
+    return _median(workload, repeat)
+
+
+def _median(fn: Callable[[], Any], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_case(jar_cls: type, root: str, repeat: int) -> Dict[str, float]:
+    cli = FakeDockerClient()
+    mason.client._client, mason.client._client_pid = cli, os.getpid()
+
+    def cold_init():
+        jar_cls._templates.clear()
+        return jar_cls(root=root)
+
+    def cold_mainfile():
+        mason.trace._source_cache.clear()
+        mason.trace._module_cache.clear()
+        return cold_init().mainfile
+
+    jar = jar_cls(root=root)
+    jar.mainfile
+    jar.registry = "bench.registry"
+
+    results = {
+        "init_cold": _median(cold_init, repeat),
+        "init": _median(lambda: jar_cls(root=root), repeat),
+        "mainfile_cold": _median(cold_mainfile, repeat),
+        "mainfile_new_instance": _median(lambda: jar_cls(root=root).mainfile, repeat),
+        "mainfile_cached": _median(lambda: jar.mainfile, repeat),
+        "dockerfile": _median(lambda: jar.dockerfile, repeat),
+        "save": _median(jar.save, repeat),
+        "build": _median(lambda: jar.build(force=True), repeat),
+        "build_cached": _median(jar.build, repeat),
+        "run": _median(lambda: jar.run(x=1), repeat),
+        "push": _median(lambda: jar.push(verbose=False), repeat),
+    }
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="skip the big cases")
+    parser.add_argument("--save", help="write normalized timings to this file")
+    parser.add_argument("--check", help="compare against this baseline file")
+    parser.add_argument("--threshold", type=float, default=2.0)
+    args = parser.parse_args()
+
+    unit = _calibrate(args.repeat)
+    report = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for helpers, constants, depth in QUICK_CASES if args.quick else CASES:
+            name = f"helpers={helpers},constants={constants},depth={depth}"
+            jar_cls = _load_jar(folder, helpers, constants, depth)
+            with open(os.devnull, "w") as devnull:
+                stdout, sys.stdout = sys.stdout, devnull  # `run` prints
+                try:
+                    timings = bench_case(jar_cls, folder, args.repeat)
+                finally:
+                    sys.stdout = stdout
+            report[name] = {k: v / unit for k, v in timings.items()}
+            print(name)
+            for phase, seconds in timings.items():
+                print(f"  {phase:24s} {seconds * 1e3:10.3f} ms")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.check:
+        with open(args.check) as f:
+            baseline = json.load(f)
+        regressions = [
+            f"{case} {phase}: {value:.3f} vs baseline {baseline[case][phase]:.3f}"
+            for case, phases in report.items()
+            for phase, value in phases.items()
+            if phase in baseline.get(case, {})
+            and value > args.threshold * baseline[case][phase]
+            and value - baseline[case][phase] > NOISE_FLOOR
+        ]
+        if regressions:
+            print("Regressions beyond", args.threshold, "x baseline:")
+            print("\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
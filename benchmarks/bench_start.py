@@ -0,0 +1,95 @@
+"""Benchmark start-to-entrypoint latency of the generated main file.
+
+The same jar is rendered with and without `fast_start`, then its `main.py` is
+started repeatedly with the local interpreter (or, with `--docker`, built and
+run as a container) and the wall time until the process exits is reported.
+The entrypoint returns right away, so the timings are startup cost only:
+
+    python benchmarks/bench_start.py
+    python benchmarks/bench_start.py --docker --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import *
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import mason  # noqa: E402
+
+
+class StartJar(mason.Jar):
+
+    base_image = "python:3.8-slim"
+
+    def setup_image(self):
+        pass
+
+    def constants(self):
+        self.table = {i: str(i) for i in range(100)}
+
+    def entrypoint(self, x: int, names: List[str], verbose: bool = False):
+        import asyncio  # frontmatter
+        import decimal  # frontmatter
+        import email.parser  # frontmatter
+        import json  # frontmatter
+
+        if verbose:  # the heavy imports are only needed here
+            print(json.dumps(self.table), decimal.Decimal(x), asyncio, email.parser)
+
+
+class FastStartJar(StartJar):
+
+    fast_start = True
+
+
+def _median(fn: Callable[[], Any], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_local(jar: mason.Jar, repeat: int) -> float:
+    jar.save()
+    if jar.fast_start:  # what `RUN python -m compileall` does in the image
+        subprocess.run([sys.executable, "-m", "compileall", "-q", jar.path], check=True)
+    cmd = [sys.executable, os.path.join(jar.path, "main.py"), "--x", "1"]
+    cmd += ["--names", "a", "b"]
+
+    return _median(lambda: subprocess.run(cmd, check=True), repeat)
+
+
+def bench_docker(jar: mason.Jar, repeat: int) -> float:
+    jar.build()
+    cli = mason.get_docker_client()
+    cmd = jar._command(dict(x=1, names=["a", "b"]))
+
+    return _median(
+        lambda: cli.containers.run(jar.container_name, cmd, remove=True), repeat
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--docker", action="store_true", help="run containers")
+    args = parser.parse_args()
+
+    bench = bench_docker if args.docker else bench_local
+    with tempfile.TemporaryDirectory() as root:
+        for jar_cls in (StartJar, FastStartJar):
+            seconds = bench(jar_cls(root=root), args.repeat)
+            print(f"{jar_cls.__name__:16s} {seconds * 1e3:10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
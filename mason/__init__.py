@@ -1,5 +1,15 @@
+from .aio import *
+from .analyze import *
 from .base import *
+from .buildkit import *
 from .client import *
+from .files import SaveReport
+from .layers import *
+from .progress import *
+from .registry import *
+from .runner import *
+from .spans import *
+from .stages import *
 from .trace import include
 
 __version__ = "0.1.8"
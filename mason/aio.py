@@ -0,0 +1,207 @@
+import asyncio
+import getpass
+import gzip
+import json
+import shlex
+import sys
+import time
+from typing import *
+
+from .client import DIGEST_LABEL, get_async_docker_client
+from .path import host_config
+from .progress import BuildSummary, StepTracker
+from .registry import PushResult, PushTracker
+from .runner import RunResult
+
+__all__ = ["AsyncOperation", "abuild", "arun", "apush", "alogin"]
+
+
+class AsyncOperation:
+    """AsyncOperation:
+    a docker operation driven by asyncio without a thread. Await it for its
+    result or iterate it once with `async for` to receive progress as it
+    happens, `result` is set once the iteration ends.
+
+    Cancelling the awaiting task, or exceeding `timeout` (seconds, see
+    `within`), aborts the operation: the daemon connection is closed and
+    containers started by it are removed.
+    """
+
+    def __init__(self, events: Callable[["AsyncOperation"], AsyncIterator]):
+        self._events = events
+        self.timeout: Optional[float] = None
+        self.result: Any = None
+
+    def within(self, timeout: Optional[float]) -> "AsyncOperation":
+        self.timeout = timeout
+        return self
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        events = self._events(self)
+        try:
+            while True:
+                remaining = None
+                if deadline is not None:
+                    remaining = max(deadline - loop.time(), 0.0)
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), remaining)
+                except StopAsyncIteration:
+                    return
+                yield event
+        finally:
+            await events.aclose()
+
+    async def _drain(self):
+        async for _ in self:
+            pass
+        return self.result
+
+    def __await__(self):
+        return self._drain().__await__()
+
+
+def abuild(jar, force: bool = False) -> AsyncOperation:
+    """Build `jar` like `Jar.build(stream=True)`, yielding `BuildEvent`s. The
+    result is a `BuildSummary` whose `image` is the image id."""
+
+    async def events(op: AsyncOperation):
+        digest = jar.digest
+        async with get_async_docker_client() as docker:
+            if not force:
+                filters = json.dumps({"label": [f"{DIGEST_LABEL}={digest}"]})
+                images = await docker.images.list(filters=filters)
+                if images:
+                    await docker.images.tag(images[0]["Id"], jar.container_name)
+                    op.result = BuildSummary(images[0]["Id"], [], 0.0, cached=True)
+                    return
+
+            start = time.perf_counter()
+            context = jar.build_context()
+            tracker = StepTracker(jar.container_name, jar._build_lines())
+            async for chunk in docker.images.build(
+                fileobj=gzip.compress(context.fileobj.read()),
+                encoding="gzip",
+                tag=jar.container_name,
+                labels={DIGEST_LABEL: digest},
+                stream=True,
+            ):
+                for event in tracker.feed(chunk, time.perf_counter()):
+                    yield event
+
+            now = time.perf_counter()
+            for event in tracker.finish(now):
+                yield event
+
+            op.result = BuildSummary(
+                tracker.image_id, tracker.steps, now - start, False, context.size
+            )
+
+    return AsyncOperation(events)
+
+
+def arun(jar, kwargs: Dict[str, Any]) -> AsyncOperation:
+    """Run `jar` with entrypoint `kwargs` in a fresh container, yielding its
+    output line by line. The result is a `RunResult`, the container is removed
+    afterwards."""
+
+    async def events(op: AsyncOperation):
+        async with get_async_docker_client() as docker:
+            start = time.perf_counter()
+            config = {
+                "Image": jar.container_name,
+                "Cmd": shlex.split(jar._command(kwargs)),
+            }
+            mounts = host_config(jar._run_options())
+            if mounts:
+                config["HostConfig"] = mounts
+            container = await docker.containers.run(config)
+            try:
+                stdout = []
+                async for line in container.log(stdout=True, follow=True):
+                    stdout.append(line)
+                    yield line
+                status = await container.wait()
+                stderr = await container.log(stderr=True)
+            finally:
+                await asyncio.shield(container.delete(force=True))
+
+            op.result = RunResult(
+                kwargs,
+                status["StatusCode"],
+                "".join(stdout),
+                "".join(stderr),
+                time.perf_counter() - start,
+            )
+
+    return AsyncOperation(events)
+
+
+def apush(jar) -> AsyncOperation:
+    """Push `jar` to its registry, yielding condensed `PushProgress`. The result
+    is a `PushResult`. Credentials come from the last `Jar.alogin` of `jar`, a
+    synchronous `login` keeps them in the docker client only, so the push is
+    sent without credentials then."""
+
+    if jar.registry is None:
+        raise ValueError("Registry should not be empty. Please login first.")
+
+    async def events(op: AsyncOperation):
+        registry_tag = f"{jar.registry}:{jar.container_name}"
+        auth = jar._registry_auth
+        if auth is not None:
+            auth = dict(auth, serveraddress=jar.registry)
+        async with get_async_docker_client() as docker:
+            start = time.perf_counter()
+            await docker.images.tag(
+                jar.container_name, registry_tag, tag=jar.container_name
+            )
+            result = PushResult(registry_tag, attempts=1)
+            tracker = PushTracker(registry_tag)
+            async for chunk in docker.images.push(registry_tag, auth=auth, stream=True):
+                result.logs.append(chunk)
+                update = tracker.feed(chunk)
+                if update is not None:
+                    yield update
+
+            result.bytes, result.skipped = tracker.bytes, tracker.skipped
+            result.elapsed = time.perf_counter() - start
+            op.result = result
+
+    return AsyncOperation(events)
+
+
+def _query_json(docker):
+    """`Docker._query_json` of aiodocker, which has no public wrapper of `POST
+    /auth`."""
+    query = getattr(docker, "_query_json", None)
+    if query is None:
+        version = getattr(sys.modules.get("aiodocker"), "__version__", "unknown")
+        raise RuntimeError(
+            f"alogin does not support aiodocker {version}, please use `login`."
+        )
+    return query
+
+
+async def alogin(
+    username: str,
+    registry: str,
+    password: Optional[str] = None,
+    timeout: Optional[float] = None,
+    **kwargs,
+):
+    """Async counterpart of `client.login`, keeps no credentials (see
+    `Jar.alogin`)."""
+
+    if not password:
+        password = getpass.getpass()
+
+    async def _login():
+        auth = dict(username=username, password=password, serveraddress=registry)
+        async with get_async_docker_client() as docker:
+            return await _query_json(docker)(
+                "auth", "POST", data=json.dumps(dict(auth, **kwargs))
+            )
+
+    return await asyncio.wait_for(_login(), timeout)
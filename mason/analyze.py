@@ -0,0 +1,205 @@
+import inspect
+import sys
+from dataclasses import dataclass
+from typing import *
+
+from . import trace
+from .client import DIGEST_LABEL
+from .optimize import _RUN_JOIN
+from .progress import BuildStep
+
+__all__ = ["LayerInfo", "ImageReport", "image_report"]
+
+
+class OriginLines(list):
+    """OriginLines:
+    `dockerfile_lines` while a jar sets up, remembering in `origins` which
+    class of the jar emitted each line: the first enclosing frame running a
+    method that class defines.
+    """
+
+    def __init__(self, codes: Dict[Any, str], lines: Iterable[str] = ()):
+        super().__init__(lines)
+        self.codes = codes
+        self.origins: Dict[str, str] = {}
+
+    def append(self, line: str):
+        super().append(line)
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code not in self.codes:
+            frame = frame.f_back
+        if frame is not None:
+            self.origins.setdefault(line, self.codes[frame.f_code])
+
+
+def method_codes(jar_cls: type, base: type) -> Dict[Any, str]:
+    """Code objects of the methods `jar_cls` and its ancestors below `base`
+    define -> qualified name of the defining class."""
+    codes = {}
+    for cls in jar_cls.__mro__:
+        if cls is base or not issubclass(cls, base):
+            continue
+        for value in vars(cls).values():
+            if isinstance(value, trace._IncludeDecorator):
+                value = value.method
+            value = getattr(value, "__func__", value)
+            if inspect.isfunction(value):
+                codes.setdefault(value.__code__, cls.__qualname__)
+    return codes
+
+
+@dataclass
+class LayerInfo:
+
+    line: str  # instruction of the rendered Dockerfile
+    origin: Optional[str]  # jar class that emitted it, None for mason's own
+    size: int  # bytes the instruction adds to the image
+    elapsed: Optional[float] = None  # seconds, None unless the step ran
+    cached: Optional[bool] = None  # None unless the step ran
+
+
+@dataclass
+class ImageReport:
+
+    image: Any
+    base_size: int  # bytes of the base image
+    layers: List[LayerInfo]  # instructions of the final stage, in order
+
+    @property
+    def size(self) -> int:
+        return self.base_size + sum(layer.size for layer in self.layers)
+
+    def offenders(self, n: int = 3) -> List[LayerInfo]:
+        """The `n` instructions that add the most bytes."""
+        layers = [layer for layer in self.layers if layer.size > 0]
+        return sorted(layers, key=lambda layer: layer.size, reverse=True)[:n]
+
+    def by_origin(self) -> Dict[Optional[str], int]:
+        """Bytes added per emitting jar class."""
+        sizes: Dict[Optional[str], int] = {}
+        for layer in self.layers:
+            sizes[layer.origin] = sizes.get(layer.origin, 0) + layer.size
+        return sizes
+
+    def __str__(self):
+        offenders = self.offenders()
+        lines = [f"image size {self.size} bytes, base image {self.base_size} bytes"]
+        for layer in self.layers:
+            flag = " <<" if any(layer is o for o in offenders) else ""
+            elapsed = "" if layer.elapsed is None else f"{layer.elapsed:.1f}s"
+            cached = " (cached)" if layer.cached else ""
+            instruction = layer.line.split("\n", 1)[0]
+            lines.append(
+                f"  {layer.size:12d} {elapsed:>8s} {layer.origin or '-':20s} "
+                f"{instruction}{cached}{flag}"
+            )
+        return "\n".join(lines)
+
+
+def _origin(line: str, origins: Dict[str, str]) -> Optional[str]:
+    if line in origins:
+        return origins[line]
+    # a `RUN`/`ENV` coalesced by `optimize_layers`, credit every contributor
+    instruction, _, args = line.partition(" ")
+    # commands of a `RUN`, `KEY=value` pairs of an `ENV`
+    split = (lambda a: a.split(_RUN_JOIN)) if instruction == "RUN" else str.split
+    parts = set(split(args))
+    names = []
+    for source, name in origins.items():
+        source_instruction, _, source_args = source.partition(" ")
+        if (
+            source_instruction == instruction
+            and set(split(source_args)) <= parts
+            and name not in names
+        ):
+            names.append(name)
+    return ", ".join(names) or None
+
+
+# instructions a history entry can record, see `_created_instruction`
+_INSTRUCTIONS = {
+    "ADD",
+    "ARG",
+    "CMD",
+    "COPY",
+    "ENTRYPOINT",
+    "ENV",
+    "EXPOSE",
+    "HEALTHCHECK",
+    "LABEL",
+    "MAINTAINER",
+    "ONBUILD",
+    "RUN",
+    "SHELL",
+    "STOPSIGNAL",
+    "USER",
+    "VOLUME",
+    "WORKDIR",
+}
+
+
+def _created_instruction(created_by: str) -> str:
+    """Instruction of an image history entry: the classic builder records
+    `/bin/sh -c #(nop)  ENV ...` for metadata and `/bin/sh -c cmd` for `RUN`,
+    BuildKit the instruction itself."""
+    text = created_by.strip()
+    if text.startswith("/bin/sh -c #(nop)"):
+        text = text[len("/bin/sh -c #(nop)") :].strip()
+    instruction = text.split(" ", 1)[0].upper()
+    return instruction if instruction in _INSTRUCTIONS else "RUN"
+
+
+def _matches(line: str, entry: Dict[str, Any]) -> bool:
+    """Whether history `entry` may have been added by Dockerfile `line`."""
+    created_by = entry.get("CreatedBy", "")
+    if _created_instruction(created_by) != line.split(" ", 1)[0].upper():
+        return False
+    # the labels of the build itself are recorded as a trailing `LABEL`
+    return DIGEST_LABEL in line or DIGEST_LABEL not in created_by
+
+
+def image_report(
+    image: Any,
+    dockerfile_lines: List[str],
+    origins: Dict[str, str],
+    steps: Iterable[BuildStep] = (),
+    cached: bool = False,
+) -> ImageReport:
+    """Map the history of `image`, built from `dockerfile_lines`, back to the
+    instructions of its final stage, with the build `steps` timings. `cached`
+    marks an image reused as a whole."""
+    stage = []
+    for line in dockerfile_lines:
+        if line.startswith("FROM "):
+            stage = []
+        elif line.strip() and not line.lstrip().startswith("#"):
+            stage.append(line)
+
+    # newest first, trailing entries the stage did not emit (e.g. the `LABEL`
+    # of the build labels) are skipped
+    history = list(image.history())
+    while stage and history and not _matches(stage[-1], history[0]):
+        history.pop(0)
+    # oldest first
+    history.reverse()
+    if len(history) < len(stage):
+        raise RuntimeError(
+            f"Image history has {len(history)} entries for {len(stage)} instructions."
+        )
+    base = history[: len(history) - len(stage)]
+    ran = {step.line: step for step in steps if step.line is not None}
+
+    layers = []
+    for line, entry in zip(stage, history[len(base) :]):
+        step = ran.get(line)
+        layers.append(
+            LayerInfo(
+                line,
+                _origin(line, origins),
+                entry.get("Size", 0),
+                None if step is None else step.elapsed,
+                (cached or None) if step is None else step.cached,
+            )
+        )
+
+    return ImageReport(image, sum(entry.get("Size", 0) for entry in base), layers)
@@ -1,16 +1,70 @@
+import contextlib
+import copy
+import getpass
+import hashlib
 import inspect
+import itertools
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, replace
 from typing import *
 
 from . import trace
-from .client import get_docker_client, login, push
-from .path import PathMirror
+from .aio import AsyncOperation, abuild, alogin, apush, arun
+from .analyze import ImageReport, OriginLines, image_report, method_codes
+from .buildkit import buildkit_image, cache_mount, uses_buildkit
+from .client import build_image, get_docker_client, login, push
+from .context import (
+    BuildContext,
+    build_context,
+    context_sources,
+    dockerignore,
+    hash_sources,
+)
+from .files import SaveReport, write_if_changed
+from .layers import build_layered
+from .optimize import CACHE_BARRIER, LayerReport, count_layers, optimize_dockerfile
+from .path import PathMirror, run_options
+from .pool import ContainerPool
+from .progress import BuildStream
+from .runner import (
+    Output,
+    RunHandle,
+    RunResult,
+    call_main,
+    echo,
+    load_main,
+    run_container,
+    start_container,
+    timed,
+)
+from .sidecar import SIDECAR_DIR, SIDECAR_LOADER, SIDECAR_NAME, Sidecar, render_constant
+from .spans import span
+from .stages import BUILDER_STAGE, SizeReport
 
 __all__ = ["Jar"]
 
 _DEFAULT_REGISTRY = "registry.hub.docker.com"
 
 
+def _parse_list(x):
+    if isinstance(x, (list, tuple)):
+        return " ".join(str(i) for i in x)
+    else:
+        return x
+
+
+@dataclass
+class _JarTemplate:
+
+    attributes: Dict[str, Any]  # attributes of `_SETUP_ATTRS`, shared
+    state: Optional[Dict[str, Any]]  # other attributes, copied (None: uncopyable)
+    dockerfile_lines: Tuple[str, ...]
+    # (registry snapshot, rendered main file), see `Jar.mainfile`
+    mainfile_cache: Optional[Tuple[tuple, str]] = None
+
+
 class Jar:
     """
     Jar Base Class.
@@ -54,15 +108,54 @@ class Jar:
     Use `@include` to attach optional helper methods which will be exported in
     main file as functions
 
-    Use `save` to save Dockerfile and main file to a folder in root directory
+    Set `fast_start = True` for containers that start faster: the main file is
+    precompiled in the image, arguments skip `argparse` and plain frontmatter
+    imports load on first use
+
+    Set `eliminate_dead_code = True` to leave the helpers, constants and
+    frontmatter imports that `entrypoint` does not reach out of the main file
 
-    Use `build` to build image
+    `setup_image` runs once per class and `__init__` arguments, later instances
+    share its result and copy a registry only when they change it (classes
+    overriding `__init__` run it per instance). `constants` runs per instance
 
-    Use `run` to run the mainfile in docker image
+    Use `save` to save Dockerfile, main file and a matching `.dockerignore` to a
+    folder in root directory, unchanged files are left untouched and a
+    `SaveReport` is returned
+
+    Define `setup_builder` to add a builder stage (`FROM builder_image`) for
+    compilers and toolchains, `copy_artifact` copies its outputs into the image
+    and `size_report` compares the sizes of both
+
+    Set `optimize_layers = True` to coalesce adjacent `RUN` and `ENV` lines, use
+    `cache_barrier` in `setup_image` to pin points that must not be merged and
+    `layer_report` to compare layer counts
+
+    Use `build` to build image from a minimal in-memory context holding only the
+    files the Dockerfile references, images whose `digest` already exists
+    locally are reused unless `force=True`. With `layered=True` every ancestor's
+    `setup_image` is built once as an intermediate image (see `build_layered`).
+    With `stream=True` a `BuildStream` of structured progress events is returned
+
+    Use `map` to call the entrypoint eagerly over a batch of kwargs on a process
+    pool
+
+    Use `run` to run the mainfile in docker image, its output is printed as it
+    is written, `start` runs it detached and streams the output to a callback
+    or file, `run_many` to run a batch of kwargs concurrently, after
+    `start_pool` runs are dispatched to warm worker containers until `stop_pool`
 
     Use `login` to login your registry
 
-    Use `push` to push your image to registry
+    Use `push` to push your image to registry, `push_many` pushes several jars
+    concurrently
+
+    Use `abuild`, `arun`, `alogin` and `apush` from asyncio code (requires
+    `aiodocker`), the returned operations can be awaited or iterated with
+    `async for` to stream progress
+
+    Call `mason.enable_tracing()` (or set `MASON_TRACE`) to record timing spans
+    of every lifecycle phase, see `mason.spans`
 
     Params:
 
@@ -73,7 +166,24 @@ class Jar:
 
     REPR_INDENT = 2
     base_image: str
+    # base image of the `setup_builder` stage, defaults to `base_image`
+    builder_image: Optional[str] = None
     registry: Optional[str] = None
+    # credentials of `alogin`, kept on the jar for `apush` only
+    _registry_auth: Optional[Dict[str, str]] = None
+    # coalesce `RUN`/`ENV` instructions when rendering the Dockerfile
+    optimize_layers: bool = False
+    # leave helpers, constants and frontmatter imports the entrypoint does not
+    # reach out of the main file
+    eliminate_dead_code: bool = False
+    # numpy array constants, and constants whose source would be longer than
+    # this many characters, are saved as sidecar files (None inlines them all)
+    sidecar_threshold: Optional[int] = 64 * 1024
+    # precompile the main file in the image, parse arguments without `argparse`
+    # and load plain frontmatter imports on first use
+    fast_start: bool = False
+    # seconds `run` waits for its container before killing it, None waits
+    run_timeout: Optional[float] = None
     # eager reference name `method_name` -> graph `_original_method_name`
     _helper_registry: Dict[str, str]
     # constants to be included in the main file
@@ -81,34 +191,130 @@ class Jar:
     # path registry: human readable name -> PathMirror(eager_path, graph_path)
     _path_registry: Dict[str, PathMirror]
 
+    # registries shared with the class template until first written
+    _SHARED_REGISTRIES = ("_path_registry", "_helper_registry")
+    # attributes `_setup` leaves on every jar, shared with the class template
+    _SETUP_ATTRS = {
+        "_path_registry",
+        "_helper_registry",
+        "_setup_kwargs",
+        "_setup_end",
+        "_line_origins",
+        "builder_lines",
+    }
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # (python, path, setup kwargs) -> _JarTemplate
+        cls._templates: Dict[tuple, _JarTemplate] = {}
+        cls._class_helpers = {"entrypoint": "entrypoint"}
+        for attr in dir(cls):
+            value = inspect.getattr_static(cls, attr)
+            if isinstance(value, trace._IncludeDecorator):
+                cls._class_helpers[value.method.__name__] = value.graph_name
+                setattr(cls, value.graph_name, staticmethod(value.method))
+
     def __init__(self, root: str = ".", py3: bool = True, **kwargs: Any):
         self.python = "python3" if py3 else "python"
         self.container_name = self.__class__.__name__.lower()
         self.path = os.path.join(root, f"{self.container_name}")
+        self._pool: Optional[ContainerPool] = None
+        # (registry snapshot, rendered main file)
+        self._mainfile_cache: Optional[Tuple[tuple, str]] = None
+        # rendered constants, within `_rendering` only
+        self._constants_cache: Optional[Tuple[List[str], List[Sidecar]]] = None
+        self._shared: Set[str] = set()
+        key, template = None, None
+        # an overridden `__init__` may set state the setup phases depend on
+        if type(self).__init__ is Jar.__init__:
+            try:
+                key = (self.python, self.path, tuple(sorted(kwargs.items())))
+                template = self._templates.get(key)
+            except TypeError:  # unhashable setup kwargs, not cached
+                key = None
+
+        with self._span("init", cached=template is not None):
+            if template is None:
+                template = self._setup(kwargs)
+                if key is not None and template.state is not None:
+                    self._templates[key] = template
+            self._apply(template)
+            self._constant_registry = {}
+            with self._span("constants"):
+                self.constants()
+
+    def _setup(self, kwargs: Dict[str, Any]) -> "_JarTemplate":
+        """Run the setup phases, returns the attributes they add."""
+        existing = set(self.__dict__)
         self._path_registry = {}
-        self.dockerfile_lines = [f"FROM {self.base_image}"]
-        self.setup_image(**kwargs)
+        self._setup_kwargs = kwargs
+        self.builder_lines: Tuple[str, ...] = ()
+        # Dockerfile line -> jar class that emitted it, see `analyze`
+        self._line_origins: Dict[str, str] = {}
+        codes = method_codes(type(self), Jar)
+        if type(self).setup_builder is not Jar.setup_builder:
+            builder_image = self.builder_image or self.base_image
+            self.dockerfile_lines = OriginLines(
+                codes, [f"FROM {builder_image} AS {BUILDER_STAGE}"]
+            )
+            with self._span("setup_builder"):
+                self.setup_builder(**kwargs)
+            self.builder_lines = tuple(self.dockerfile_lines)
+            self._line_origins.update(self.dockerfile_lines.origins)
+        self.dockerfile_lines = OriginLines(codes, [f"FROM {self.base_image}"])
+        with self._span("setup_image"):
+            self.setup_image(**kwargs)
+        self._setup_end = len(self.dockerfile_lines)
+        self._line_origins.update(self.dockerfile_lines.origins)
+        self.dockerfile_lines = list(self.dockerfile_lines)
         self.COPY("main.py", "/entrypoint/")
-        self._constant_registry = {}
-
-        self.constants()
-        self._helper_registry = {}
-        self._helper_registry["entrypoint"] = "entrypoint"
-        self._record_methods()
-
-    def _record_methods(self):
-        _exclude = {
-            "_helper_registry",
-            "_constant_registry",
-            "dockerfile",
-            "mainfile",
-            "entrypoint",
-            "setup_image",
+        self._helper_registry = self._class_helpers
+
+        added = {
+            k: v
+            for k, v in self.__dict__.items()
+            if k not in existing and k != "dockerfile_lines"
         }
-        for attr in dir(self.__class__):
-            if attr in _exclude or attr.startswith("__"):
-                continue
-            _ = getattr(self, attr)
+        attributes = {k: v for k, v in added.items() if k in self._SETUP_ATTRS}
+        try:  # snapshot, so later changes to this instance are not taken over
+            state = copy.deepcopy(
+                {k: v for k, v in added.items() if k not in self._SETUP_ATTRS}
+            )
+        except Exception:
+            state = None
+        return _JarTemplate(attributes, state, tuple(self.dockerfile_lines))
+
+    def _apply(self, template: "_JarTemplate"):
+        """Take the attributes of `template` this instance does not have yet,
+        its registries are shared until written (see `_writable`) and the other
+        attributes the setup phases added are copied."""
+        for name, value in template.attributes.items():
+            self.__dict__.setdefault(name, value)
+        memo: Dict[int, Any] = {}
+        for name, value in (template.state or {}).items():
+            if name not in self.__dict__:
+                self.__dict__[name] = copy.deepcopy(value, memo)
+        object.__setattr__(self, "dockerfile_lines", list(template.dockerfile_lines))
+        object.__setattr__(self, "_template", template)
+        self._shared.update(self._SHARED_REGISTRIES)
+
+    def _writable(self, name: str) -> dict:
+        """Registry `name` of this instance, copied from the class template on
+        first write."""
+        if name in self._shared:
+            self._shared.remove(name)
+            object.__setattr__(self, name, dict(getattr(self, name)))
+        return getattr(self, name)
+
+    def _span(self, name: str, **attributes):
+        """Tracing span of a lifecycle phase, see `mason.spans`."""
+        return span(
+            name, jar=type(self).__name__, tag=self.container_name, **attributes
+        )
+
+    def setup_builder(self, **kwargs):
+        """Optionally setup a builder stage here, its artifacts are copied into
+        the image with `copy_artifact`."""
 
     def setup_image(self, **kwargs):
         raise NotImplementedError("Please setup docker image here.")
@@ -119,12 +325,25 @@ class Jar:
     def constants(self):
         """Define constants here."""
 
-    def add_path_mirror(self, path_name: str, eager_path: str, graph_path: str):
-        self._path_registry[path_name] = PathMirror(eager_path, graph_path)
+    def add_path_mirror(
+        self,
+        path_name: str,
+        eager_path: str,
+        graph_path: str,
+        mode: Optional[str] = None,
+    ):
+        """Map `eager_path` to `graph_path` in the container, where runs mount
+        it read-only (`mode="ro"`), read-write (`"rw"`), as an empty tmpfs
+        (`"tmpfs"`) or not at all (None, the default, e.g. when it is copied
+        into the image). Relative eager paths are mounted from `root`, a mounted
+        `graph_path` must be absolute."""
+        self._writable("_path_registry")[path_name] = PathMirror(
+            eager_path, graph_path, mode
+        )
 
     def get_eager_path(self, path_name: str):
         if path_name in self._path_registry:
-            return self._path_registry[path_name].eager_path
+            return self._eager_path_dict()[path_name]
         else:
             raise ValueError(f"Path name {path_name} does not exist")
 
@@ -139,15 +358,25 @@ class Jar:
         return self._eager_path_dict()
 
     def _eager_path_dict(self):
-        return {name: mirror.eager_path for name, mirror in self._path_registry.items()}
+        """Eager paths, bind mounted ones resolved against `root` like the
+        mounts of `_run_options`."""
+        root = os.path.dirname(self.path)
+        return {
+            name: mirror.host_path(root) if mirror.bound else mirror.eager_path
+            for name, mirror in self._path_registry.items()
+        }
 
     def _graph_path_dict(self):
         return {name: mirror.graph_path for name, mirror in self._path_registry.items()}
 
+    def _run_options(self) -> Dict[str, Any]:
+        """`containers.run` arguments mounting the path mirrors."""
+        return run_options(self._path_registry.values(), os.path.dirname(self.path))
+
     def __setattr__(self, key: str, value: Any):
         """Record constants after instance created."""
         if hasattr(self, "_constant_registry") and not key.startswith("_"):
-            self._constant_registry[key] = value
+            self._writable("_constant_registry")[key] = value
 
         object.__setattr__(self, key, value)
 
@@ -156,13 +385,47 @@ class Jar:
             raise ValueError("Only kwargs are allowed.")
         self.entrypoint(**kwargs)
 
+    def map(
+        self,
+        kwargs_list: Iterable[Dict[str, Any]],
+        processes: Optional[int] = None,
+        return_exceptions: bool = False,
+    ) -> List[Any]:
+        """Eagerly call the entrypoint once per kwargs on a pool of `processes`.
+
+        Workers execute the rendered main file, like the container does, so
+        helpers need not be picklable. Results come back in submission order,
+        the first exception is raised unless `return_exceptions`, which puts
+        exceptions in place of their results.
+        """
+        main_path = None
+        with self._rendering():
+            if self._render_constants()[1]:
+                self._save_sidecars(SaveReport(self.path))
+                main_path = os.path.join(self.path, "main.py")
+            mainfile = self.mainfile
+
+        with ProcessPoolExecutor(
+            processes,
+            initializer=load_main,
+            initargs=(mainfile, self._eager_path_dict(), main_path),
+        ) as pool:
+            futures = [pool.submit(call_main, kwargs) for kwargs in kwargs_list]
+            if not return_exceptions:
+                return [f.result() for f in futures]
+
+            return [f.exception() or f.result() for f in futures]
+
     def ENV(self, *args):
         for arg in args:
             self.dockerfile_lines.append(f"ENV {arg}")
 
-    def RUN(self, *args):
+    def RUN(self, *args, cache: Union[None, str, Iterable[str]] = None):
+        """`cache` keeps package manager caches (presets of `CACHE_MOUNTS`, or
+        absolute paths) across builds as BuildKit cache mounts."""
+        mount = f"{cache_mount(cache)} " if cache else ""
         for arg in args:
-            self.dockerfile_lines.append(f"RUN {arg}")
+            self.dockerfile_lines.append(f"RUN {mount}{arg}")
 
     def ADD(self, out_dir: str, in_dir: str):
         self.dockerfile_lines.append(f"ADD {out_dir} {in_dir}")
@@ -186,78 +449,467 @@ class Jar:
     def WORKDIR(self, path):
         self.dockerfile_lines.append(f"WORKDIR {path}")
 
-    @property
-    def dockerfile(self):
-        return "\n".join(self.dockerfile_lines)
+    def copy_artifact(self, out_dir: str, in_dir: str):
+        """Copy `out_dir` of the builder stage to `in_dir` of the image."""
+        self.COPY(out_dir, in_dir, flag=f"--from={BUILDER_STAGE}")
+
+    def cache_barrier(self):
+        """Keep the instructions before and after apart when optimizing layers."""
+        self.dockerfile_lines.append(CACHE_BARRIER)
+
+    def _main_lines(self) -> List[str]:
+        """Instructions that put the main file into the image."""
+        if not self.fast_start:
+            return [self.dockerfile_lines[self._setup_end]]
+        return [
+            f"COPY main.py {trace.MAIN_MODULE}.py /entrypoint/",
+            f"RUN {self.python} -m compileall -q /entrypoint",
+        ]
+
+    def _source_lines(self) -> List[str]:
+        """Dockerfile instructions of the builder stage and the image, with the
+        `COPY` of the sidecar files, if any, and `_main_lines` in place of `COPY
+        main.py`."""
+        sidecars = self._render_constants()[1]
+        lines = self.dockerfile_lines
+        if not sidecars and not self.fast_start and not self.builder_lines:
+            return lines
+        copy = []
+        if sidecars:
+            sources = " ".join(sidecar.path for sidecar in sidecars)
+            copy.append(f"COPY {sources} /entrypoint/{SIDECAR_DIR}/")
+        return (
+            list(self.builder_lines)
+            + lines[: self._setup_end]
+            + copy
+            + self._main_lines()
+            + lines[self._setup_end + 1 :]
+        )
+
+    def _build_lines(self) -> List[str]:
+        """Dockerfile instructions as they are built."""
+        lines = self._source_lines()
+        if not self.optimize_layers:
+            return lines
+        return optimize_dockerfile(lines, keep_last=self._main_lines())
+
+    def layer_report(self) -> LayerReport:
+        return LayerReport(
+            count_layers(list(self.builder_lines) + self.dockerfile_lines),
+            count_layers(self._build_lines()),
+        )
 
     @property
-    def mainfile(self):
-        sources = []
+    def dockerfile(self):
+        return "\n".join(self._build_lines())
+
+    @contextlib.contextmanager
+    def _rendering(self):
+        """Render the constants once for all the calls made in the block, which
+        must not change them."""
+        if self._constants_cache is not None:
+            yield
+            return
+        self._constants_cache = self._render_constants()
+        try:
+            yield
+        finally:
+            self._constants_cache = None
+
+    def _render_constants(self) -> Tuple[List[str], List[Sidecar]]:
+        """Constant lines of the main file and the sidecar files they load."""
+        if self._constants_cache is not None:
+            return self._constants_cache
         constants = []
-        frontmatters = []
+        sidecars = []
         for name, value in self._constant_registry.items():
-            if isinstance(value, str):
-                value = f"'{value}'"
-            constants.append(f"{name} = {value}")
+            line, sidecar = render_constant(name, value, self.sidecar_threshold)
+            constants.append(line)
+            if sidecar is not None:
+                sidecars.append(sidecar)
 
         constants.append(f"path_dict = {self._graph_path_dict()}")
 
-        for eager_name, graph_name in self._helper_registry.items():
-            source, frontmatter = trace.get_function_source(
-                getattr(self, graph_name), eager_name
-            )
-            if len(source) > 0:
-                sources.append(source)
-            if len(frontmatter) > 0:
-                frontmatters.append(frontmatter)
+        return constants, sidecars
+
+    def _constant_lines(self) -> List[str]:
+        return self._render_constants()[0]
+
+    @property
+    def mainfile(self):
+        with self._span("mainfile") as s:
+            constants, sidecars = self._render_constants()
+            # rendered constants cover both `_constant_registry` and `_path_registry`
+            snapshot = (tuple(constants), tuple(self._helper_registry.items()))
+            # instances of the same template usually render the same main file
+            cache = self._mainfile_cache or self._template.mainfile_cache
+            cache_hit = cache is not None and cache[0] == snapshot
+            s.set(cache_hit=cache_hit)
+            if cache_hit:
+                self._mainfile_cache = cache
+                return cache[1]
+            return self._render_mainfile(constants, sidecars, snapshot)
+
+    def _render_mainfile(
+        self, constants: List[str], sidecars: List[Sidecar], snapshot: tuple
+    ) -> str:
+        traces = {
+            eager_name: trace.get_function_trace(getattr(self, graph_name), eager_name)
+            for eager_name, graph_name in self._helper_registry.items()
+        }
+        names = trace.reachable(traces) if self.eliminate_dead_code else None
+        if names is not None:
+            traces = {k: v for k, v in traces.items() if k in names}
+            constants = [
+                line
+                for line in constants
+                if line.split(" = ", 1)[0] in names or line.startswith("path_dict = ")
+            ]
+
+        sources = []
+        frontmatters = []
+        for traced in traces.values():
+            if len(traced.inner) > 0:
+                sources.append(traced.inner)
+            for statement, binds in traced.frontmatter:
+                if names is not None and binds and not binds & names:
+                    continue
+                if self.fast_start:
+                    statement = trace.defer_import(statement)
+                if statement not in frontmatters:
+                    frontmatters.append(statement)
+        if any("_mason_lazy(" in statement for statement in frontmatters):
+            frontmatters.insert(0, trace.LAZY_IMPORT)
+
+        sidecar_names = {sidecar.name for sidecar in sidecars}
+        loaded = any(line.split(" = ", 1)[0] in sidecar_names for line in constants)
 
         mainsource = [
             "\n".join(frontmatters),
             "\n" if len(frontmatters) > 0 else "",
+            SIDECAR_LOADER if loaded else "",
             "\n".join(constants),
             "\n" if len(constants) > 0 else "",
             "\n".join(sources),
         ]
         argspec = inspect.getfullargspec(self.entrypoint)
-        return trace.get_main_source_file("\n".join(mainsource), argspec).replace(
-            "self.", ""
+        mainfile = trace.get_main_source_file(
+            "\n".join(mainsource), argspec, self.fast_start
         )
+        self._mainfile_cache = self._template.mainfile_cache = (snapshot, mainfile)
+
+        return mainfile
 
-    def save(self, overwrite=True):
-        os.makedirs(self.path, exist_ok=overwrite)
-        with open(os.path.join(self.path, "Dockerfile"), "w") as f:
-            f.write(self.dockerfile)
+    @property
+    def digest(self) -> str:
+        """Content digest of the base image reference, Dockerfile, main file and
+        the `COPY`/`ADD` sources found in `self.path`."""
+        h = hashlib.sha256()
+        with self._rendering():
+            for part in (self.base_image, self.dockerfile, self.mainfile):
+                h.update(part.encode("utf-8"))
+                h.update(b"\0")
+            hash_sources(h, self.path, self._source_lines(), self._context_files())
+        return h.hexdigest()
+
+    def save(self, overwrite=True) -> SaveReport:
+        with self._span("save") as s, self._rendering():
+            os.makedirs(self.path, exist_ok=overwrite)
+            report = SaveReport(self.path)
+            for name, content in (
+                ("Dockerfile", self.dockerfile),
+                *self._main_files().items(),
+                (".dockerignore", dockerignore(context_sources(self._source_lines()))),
+            ):
+                if write_if_changed(os.path.join(self.path, name), content):
+                    report.written.append(name)
+                else:
+                    report.unchanged.append(name)
+            self._save_sidecars(report)
+            s.set(written=len(report.written))
+
+        return report
+
+    def _save_sidecars(self, report: SaveReport):
+        """Write the sidecar files of the constants to `SIDECAR_DIR` and remove
+        the sidecar files no constant loads anymore, leaving any other file."""
+        folder = os.path.join(self.path, SIDECAR_DIR)
+        sidecars = self._render_constants()[1]
+        if sidecars:
+            os.makedirs(folder, exist_ok=True)
+        for sidecar in sidecars:
+            if write_if_changed(
+                os.path.join(self.path, sidecar.path), sidecar.payload()
+            ):
+                report.written.append(sidecar.path)
+            else:
+                report.unchanged.append(sidecar.path)
+        if os.path.isdir(folder):
+            current = {sidecar.filename for sidecar in sidecars}
+            for filename in sorted(os.listdir(folder)):
+                if (
+                    filename not in current
+                    and SIDECAR_NAME.match(filename)
+                    and os.path.isfile(os.path.join(folder, filename))
+                ):
+                    os.remove(os.path.join(folder, filename))
+                    report.removed.append(f"{SIDECAR_DIR}/{filename}")
+
+    def _main_files(self) -> Dict[str, str]:
+        """`main.py`, in fast start mode a stub importing the main file."""
+        if not self.fast_start:
+            return {"main.py": self.mainfile}
+        return {"main.py": trace.MAIN_STUB, f"{trace.MAIN_MODULE}.py": self.mainfile}
+
+    def _context_files(self) -> Dict[str, Union[str, bytes]]:
+        """Rendered files of the build context, but the Dockerfile."""
+        files = self._main_files()
+        for sidecar in self._render_constants()[1]:
+            files[sidecar.path] = sidecar.payload()
+        return files
+
+    def build_context(self) -> BuildContext:
+        """Tar stream holding the rendered Dockerfile and main file plus the
+        `COPY`/`ADD` sources found in `self.path`."""
+        with self._rendering():
+            return build_context(
+                self.path,
+                {"Dockerfile": self.dockerfile, **self._context_files()},
+                self._source_lines(),
+            )
 
-        with open(os.path.join(self.path, "main.py"), "w") as f:
-            f.write(self.mainfile)
+    def build(
+        self,
+        force: bool = False,
+        layered: bool = False,
+        stream: bool = False,
+        cache_from: Union[None, str, Iterable[str]] = None,
+        cache_to: Optional[str] = None,
+    ):
+        """Build the image unless one with the same digest exists. With
+        `cache_from` (import) or `cache_to` (export), each a local directory or
+        registry reference, or with `RUN` cache mounts, BuildKit builds it."""
+        if isinstance(cache_from, str):
+            cache_from = [cache_from]
+        with self._span(
+            "build", force=force, layered=layered, stream=stream
+        ) as s, self._rendering():
+            return self._build(force, layered, stream, s, cache_from, cache_to)
+
+    def _build(
+        self,
+        force: bool,
+        layered: bool,
+        stream: bool,
+        build_span,
+        cache_from: Optional[List[str]] = None,
+        cache_to: Optional[str] = None,
+    ):
+        buildkit = cache_from or cache_to or uses_buildkit(self._source_lines())
+        if layered:
+            if stream:
+                raise ValueError("Layered builds can not be streamed.")
+            if cache_from or cache_to:
+                raise ValueError("Layered builds do not import or export caches.")
+            return build_layered([self], force=force)[0]
+        if stream and buildkit:
+            raise ValueError("BuildKit builds can not be streamed.")
+
+        with self._span("build_context"):
+            context = self.build_context()
+        build_span.set(bytes_sent=context.size)
+        if stream:
+            return BuildStream(
+                self.digest,
+                self.container_name,
+                self._build_lines(),
+                force=force,
+                context_size=context.size,
+                fileobj=context.fileobj,
+                custom_context=True,
+            )
 
-    def build(self):
-        cli = get_docker_client()
+        if buildkit:
+            image, logs = buildkit_image(
+                self.digest,
+                self.container_name,
+                context.fileobj,
+                force=force,
+                cache_from=cache_from or (),
+                cache_to=cache_to,
+            )
+        else:
+            image, logs = build_image(
+                self.digest,
+                self.container_name,
+                force=force,
+                fileobj=context.fileobj,
+                custom_context=True,
+            )
+        build_span.set(cache_hit=not logs, buildkit=bool(buildkit))
+        if logs:
+            sending = f"Sending build context to Docker daemon {context.size} bytes\n"
+            logs = itertools.chain([{"stream": sending}], logs)
 
-        image, logs = cli.images.build(
-            path=self.path, tag=self.container_name, quiet=False
+        return image, logs
+
+    def size_report(self, force: bool = False) -> SizeReport:
+        """Build the image and its builder stage, compare their sizes."""
+        if not self.builder_lines:
+            raise ValueError("No builder stage, please define `setup_builder`.")
+
+        with self._rendering():
+            image, _ = self.build(force=force)
+            context = self.build_context()
+            digest = hashlib.sha256(f"{self.digest}:{BUILDER_STAGE}".encode("utf-8"))
+            tag = f"{self.container_name}-{BUILDER_STAGE}"
+            if uses_buildkit(self._source_lines()):
+                builder, _ = buildkit_image(
+                    digest.hexdigest(),
+                    tag,
+                    context.fileobj,
+                    force=force,
+                    target=BUILDER_STAGE,
+                )
+            else:
+                builder, _ = build_image(
+                    digest.hexdigest(),
+                    tag,
+                    force=force,
+                    fileobj=context.fileobj,
+                    custom_context=True,
+                    target=BUILDER_STAGE,
+                )
+
+        return SizeReport(builder.attrs["Size"], image.attrs["Size"])
+
+    def analyze(self, force: bool = False) -> ImageReport:
+        """Build the image and map its layers back to the `dockerfile_lines`
+        entries, and jar classes, that added them, with their size, build time
+        and cache status. `offenders` of the report are the largest layers."""
+        with self._span("analyze", force=force), self._rendering():
+            if uses_buildkit(self._source_lines()):
+                image, logs = self.build(force=force)
+                steps, cached = [], not logs
+            else:
+                stream = self.build(force=force, stream=True)
+                for _ in stream:
+                    pass
+                image, steps = stream.summary.image, stream.summary.steps
+                cached = stream.summary.cached
+
+            return image_report(
+                image, self._build_lines(), self._line_origins, steps, cached
+            )
+
+    def _arg_string(self, kwargs: Dict[str, Any]) -> str:
+        return " ".join(
+            (f"--{name} {_parse_list(value)}" for name, value in kwargs.items())
         )
 
-        return image, logs
+    def _command(self, kwargs: Dict[str, Any]) -> str:
+        return f"{self.python} /entrypoint/main.py " + self._arg_string(kwargs)
 
-    def run(self, *args, **kwargs):
+    def run(self, *args, **kwargs) -> RunResult:
+        """Run the entrypoint with `kwargs` in a container (or on a worker of
+        `start_pool`), printing its output as it is written and returning it in
+        the `RunResult`. Raises `RuntimeError` if it fails, `TimeoutError` after
+        killing it if it runs longer than `run_timeout` seconds."""
         if len(args) > 0:
             raise ValueError("Only kwargs are allowed.")
 
-        def _parse_list(x):
-            if isinstance(x, (list, tuple)):
-                return " ".join(str(i) for i in x)
-            else:
-                return x
+        if self._pool is not None and not self._pool.closed:
+            print(f">> input kwargs >> {kwargs}\n")
+            start = time.perf_counter()
+            with self._span("run", pooled=True):
+                result = self._pool.call(**kwargs)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            print(result["stdout"])
+            elapsed = time.perf_counter() - start
+            return RunResult(kwargs, 0, result["stdout"], result["stderr"], elapsed)
+
+        print(f">> input args >> {self._arg_string(kwargs)}\n")
+        kept: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+
+        def tee(stream: str, text: str):
+            kept[stream].append(text)
+            echo(stream, text)
+
+        with self._span("run", pooled=False) as s:
+            handle = self.start(kwargs, output=tee)
+            try:
+                result = handle.wait(self.run_timeout)
+            except TimeoutError:
+                handle.kill()
+                handle.wait()
+                raise
+            s.set(exit_code=result.exit_code)
+        if result.exit_code != 0:
+            raise RuntimeError(
+                f"{self.container_name} exited with code {result.exit_code}."
+            )
 
-        cli = get_docker_client()
-        arg_string = " ".join(
-            (f"--{name} {_parse_list(value)}" for name, value in kwargs.items())
+        return replace(
+            result, stdout="".join(kept["stdout"]), stderr="".join(kept["stderr"])
         )
-        print(f">> input args >> {arg_string}\n")
-        cmd = f"{self.python} /entrypoint/main.py " + arg_string
 
-        print(cli.containers.run(self.container_name, command=cmd).decode())
+    def start(
+        self, kwargs: Optional[Dict[str, Any]] = None, output: Optional[Output] = None
+    ) -> RunHandle:
+        """Start the entrypoint with `kwargs` in a detached container, its
+        output streamed to `output`: a callback `output(stream, text)`, a text
+        file object or a file path. `wait` on the handle for the result."""
+        kwargs = kwargs or {}
+        with self._span("start"):
+            return start_container(
+                self.container_name,
+                self._command(kwargs),
+                kwargs,
+                output,
+                **self._run_options(),
+            )
+
+    def _run_one(self, index: int, kwargs: Dict[str, Any]) -> RunResult:
+        def _run():
+            if self._pool is not None and not self._pool.closed:
+                result = self._pool.call(**kwargs)
+                error = result.get("error")
+                stderr = result["stderr"] + (error or "")
+                return int(error is not None), result["stdout"], stderr
+            return run_container(
+                self.container_name, self._command(kwargs), **self._run_options()
+            )
+
+        return timed(index, kwargs, _run)
+
+    def run_many(
+        self, kwargs_list: Iterable[Dict[str, Any]], max_concurrency: int = 4
+    ) -> Iterator[RunResult]:
+        """Run the image once per kwargs, at most `max_concurrency` containers
+        at a time (or on the workers of `start_pool`), yielding a `RunResult`
+        per run as soon as it completes."""
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            futures = [
+                pool.submit(self._run_one, i, kwargs)
+                for i, kwargs in enumerate(kwargs_list)
+            ]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def start_pool(self, size: int = 2, **kwargs) -> ContainerPool:
+        """Keep `size` containers of the image alive to serve `run` calls,
+        `kwargs` are passed to `containers.run` along with the path mirror
+        mounts."""
+        self.stop_pool()
+        self._pool = ContainerPool(self, size, **{**self._run_options(), **kwargs})
+
+        return self._pool
+
+    def stop_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
 
     def login(
         self,
@@ -267,12 +919,14 @@ class Jar:
         **kwargs,
     ):
 
-        info = login(username, registry, password, **kwargs)
+        with self._span("login", registry=registry):
+            info = login(username, registry, password, **kwargs)
         self.registry = registry
 
         return info
 
-    def push(self, verbose: bool = True):
+    def _tag_for_registry(self):
+        """Tag the built image for `registry`, returns `(registry_tag, image)`."""
 
         if self.registry is None:
             raise ValueError("Registry should not be empty. Please login first.")
@@ -282,10 +936,48 @@ class Jar:
         registry_tag = f"{self.registry}:{self.container_name}"
         image.tag(registry_tag, tag=self.container_name)
 
-        info = push(registry_tag, verbose)
+        return registry_tag, image
+
+    def push(self, verbose: bool = True):
+
+        with self._span("push") as s:
+            registry_tag, _ = self._tag_for_registry()
+            s.set(registry_tag=registry_tag)
+            info = push(registry_tag, verbose)
+
+        return info
+
+    def abuild(self, force: bool = False) -> AsyncOperation:
+        if uses_buildkit(self._source_lines()):
+            raise ValueError("Cache mounts need BuildKit, please use `build`.")
+        return abuild(self, force)
+
+    def arun(self, *args, **kwargs) -> AsyncOperation:
+        if len(args) > 0:
+            raise ValueError("Only kwargs are allowed.")
+        return arun(self, kwargs)
+
+    async def alogin(
+        self,
+        username: str,
+        registry: str = _DEFAULT_REGISTRY,
+        password: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ):
+        """Async `login`, the credentials are kept on the jar for `apush`."""
+        if not password:
+            password = getpass.getpass()
+
+        info = await alogin(username, registry, password, timeout, **kwargs)
+        self.registry = registry
+        self._registry_auth = dict(username=username, password=password)
 
         return info
 
+    def apush(self) -> AsyncOperation:
+        return apush(self)
+
     @staticmethod
     def docker_client():
         return get_docker_client()
@@ -0,0 +1,169 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from typing import *
+
+from .client import (
+    DIGEST_LABEL,
+    _client_options,
+    find_image,
+    get_docker_client,
+    split_tag,
+)
+
+__all__ = ["CACHE_MOUNTS", "buildkit_image", "cache_mount", "uses_buildkit"]
+
+# preset name -> directories kept across builds by `Jar.RUN(..., cache=name)`
+CACHE_MOUNTS = {
+    "pip": ("/root/.cache/pip",),
+    "apt": ("/var/cache/apt", "/var/lib/apt"),
+    "conda": ("/opt/conda/pkgs",),
+}
+
+
+def cache_mount(cache: Union[str, Iterable[str]]) -> str:
+    """`--mount=type=cache` flags of a `RUN` for preset names of `CACHE_MOUNTS`
+    or absolute target directories. Mounts are locked, so concurrent builds
+    never share a package manager cache."""
+    names = [cache] if isinstance(cache, str) else list(cache)
+    targets = []
+    for name in names:
+        if name in CACHE_MOUNTS:
+            targets.extend(CACHE_MOUNTS[name])
+        elif name.startswith("/"):
+            targets.append(name)
+        else:
+            raise ValueError(
+                f"Unknown cache {name!r}, use one of {sorted(CACHE_MOUNTS)} "
+                "or an absolute path."
+            )
+    return " ".join(
+        f"--mount=type=cache,target={target},sharing=locked" for target in targets
+    )
+
+
+def uses_buildkit(dockerfile_lines: Iterable[str]) -> bool:
+    """Whether the instructions need BuildKit, i.e. `RUN --mount`."""
+    return any(line.startswith("RUN --mount") for line in dockerfile_lines)
+
+
+def _cache_option(value: str, export: bool) -> str:
+    """`--cache-from`/`--cache-to` value of a local directory, a registry
+    reference (holding a `/` or `:`) or an explicit `type=...` spec."""
+    if "type=" in value:
+        return value
+    local = value.startswith((os.sep, ".", "~")) or os.path.isdir(value)
+    if local or not any(c in value for c in "/:"):
+        path = os.path.abspath(os.path.expanduser(value))
+        option = f"type=local,dest={path}" if export else f"type=local,src={path}"
+    else:
+        option = f"type=registry,ref={value}"
+    # `mode=max` exports the layers of every stage, not just the final one
+    return f"{option},mode=max" if export else option
+
+
+def _docker_cli() -> str:
+    docker = shutil.which("docker")
+    if docker is None:
+        raise RuntimeError(
+            "BuildKit builds need the docker CLI with buildx: "
+            "https://docs.docker.com/build/install-buildx/"
+        )
+    return docker
+
+
+def _docker_env() -> Dict[str, str]:
+    """Environment of docker CLI commands, pointed at the daemon set with
+    `configure_docker_client` if any."""
+    env = dict(os.environ)
+    base_url = _client_options.get("base_url")
+    if base_url is not None:
+        env.pop("DOCKER_CONTEXT", None)
+        env["DOCKER_HOST"] = re.sub(r"^https?://", "tcp://", base_url)
+    return env
+
+
+def _docker_output(args: List[str]) -> str:
+    """Output of the docker CLI command `args`, empty if it fails."""
+    process = subprocess.run(
+        [_docker_cli(), *args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=_docker_env(),
+    )
+    return process.stdout.decode("utf-8", "replace") if not process.returncode else ""
+
+
+def _check_cache_export():
+    """Raise unless the active buildx builder can export a layer cache, which
+    the default `docker` driver only does with the containerd image store."""
+    driver = re.search(r"^Driver:\s*(\S+)", _docker_output(["buildx", "inspect"]), re.M)
+    if driver is None or driver.group(1) != "docker":
+        return
+    status = _docker_output(["info", "--format", "{{json .DriverStatus}}"])
+    if "io.containerd.snapshotter" in status:
+        return
+    raise RuntimeError(
+        "The `docker` buildx driver can not export a build cache (`cache_to`) "
+        "without the containerd image store. Use a `docker-container` builder: "
+        "`docker buildx create --use --driver docker-container`, or enable the "
+        "containerd image store of the daemon."
+    )
+
+
+def _buildx(args: List[str], fileobj: IO[bytes]) -> List[str]:
+    """Run `docker buildx build` on the tar context `fileobj`, returns its
+    output lines."""
+    process = subprocess.run(
+        [_docker_cli(), "buildx", "build", *args, "-"],
+        input=fileobj.read(),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=_docker_env(),
+    )
+    lines = process.stdout.decode("utf-8", "replace").splitlines(keepends=True)
+    if process.returncode != 0:
+        raise RuntimeError("BuildKit build failed:\n" + "".join(lines[-20:]))
+    return lines
+
+
+def buildkit_image(
+    digest: str,
+    tag: str,
+    fileobj: IO[bytes],
+    force: bool = False,
+    cache_from: Iterable[str] = (),
+    cache_to: Optional[str] = None,
+    target: Optional[str] = None,
+):
+    """`build_image` through BuildKit: the image is loaded into the local
+    daemon, layer cache is imported from every `cache_from` and exported to
+    `cache_to` (local directories or registry references)."""
+
+    if not force:
+        image = find_image(digest)
+        if image is not None:
+            image.tag(*split_tag(tag))
+            return image, []
+
+    with tempfile.TemporaryDirectory() as folder:
+        iidfile = os.path.join(folder, "iid")
+        args = ["--load", "--progress", "plain", "--iidfile", iidfile]
+        args += ["--tag", tag, "--label", f"{DIGEST_LABEL}={digest}"]
+        if target is not None:
+            args += ["--target", target]
+        for value in cache_from:
+            args += ["--cache-from", _cache_option(value, export=False)]
+        if cache_to is not None:
+            _check_cache_export()
+            args += ["--cache-to", _cache_option(cache_to, export=True)]
+
+        lines = _buildx(args, fileobj)
+        with open(iidfile) as f:
+            image_id = f.read().strip()
+
+    image = get_docker_client().images.get(image_id)
+
+    return image, [{"stream": line} for line in lines]
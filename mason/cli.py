@@ -0,0 +1,43 @@
+import argparse
+import os
+import sys
+from typing import *
+
+__all__ = ["main"]
+
+
+def _watch(args: argparse.Namespace):
+    from .watch import Watcher
+
+    sys.path.insert(0, os.getcwd())
+    watcher = Watcher(
+        args.module,
+        root=args.root,
+        interval=args.interval,
+        debounce=args.debounce,
+        max_workers=args.max_workers,
+        layered=args.layered,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="mason")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    watch = commands.add_parser(
+        "watch", help="re-save and rebuild the jars of a module when it changes"
+    )
+    watch.add_argument("module", help="module or package holding the jars")
+    watch.add_argument("--root", default=".", help="folder jars are saved to")
+    watch.add_argument("--interval", type=float, default=0.5)
+    watch.add_argument("--debounce", type=float, default=0.5)
+    watch.add_argument("--max-workers", type=int, default=4)
+    watch.add_argument("--layered", action="store_true")
+    watch.set_defaults(func=_watch)
+
+    args = parser.parse_args(argv)
+    args.func(args)
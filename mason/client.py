@@ -1,15 +1,135 @@
 import getpass
-from typing import Optional
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+# image label holding the content digest of a jar (see `Jar.digest`)
+DIGEST_LABEL = "mason.digest"
+
+# process wide docker client shared by every jar, see `get_docker_client`
+_client = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+_client_options: Dict[str, Any] = {}
+
+
+def configure_docker_client(
+    base_url: Optional[str] = None,
+    timeout: Optional[int] = None,
+    max_pool_size: Optional[int] = None,
+    **kwargs,
+):
+    """Set the daemon url, timeout (seconds) and connection pool size of the
+    shared docker client. Options left as None fall back to the environment and
+    docker defaults. The current client, if any, is closed."""
+
+    options = dict(base_url=base_url, timeout=timeout, max_pool_size=max_pool_size)
+    options.update(kwargs)
+    with _client_lock:
+        _client_options.clear()
+        _client_options.update({k: v for k, v in options.items() if v is not None})
+    close_docker_client()
 
 
 def get_docker_client():
+    """The process wide docker client, created on first use.
+
+    It is thread safe and recreated in forked children, which must not share
+    the connection pool of their parent.
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            return _client
+
+        try:
+            import docker
+        except ImportError:
+            raise ImportError(
+                "Please install docker python client: `pip install docker`"
+            )
+
+        options = dict(_client_options)
+        if "base_url" in options:
+            _client = docker.client.DockerClient(**options)
+        else:
+            _client = docker.client.from_env(**options)
+        _client_pid = os.getpid()
+
+        return _client
+
+
+def get_async_docker_client():
+    """A new `aiodocker.Docker` session for the calling event loop, honouring
+    the daemon url of `configure_docker_client`. Use it as an async context
+    manager."""
 
     try:
-        import docker
+        import aiodocker
     except ImportError:
-        raise ImportError("Please install docker python client: `pip install docker`")
+        raise ImportError(
+            "Please install aiodocker for the asyncio API: `pip install aiodocker`"
+        )
+
+    return aiodocker.Docker(url=_client_options.get("base_url"))
+
+
+def close_docker_client():
+    """Close the shared docker client, the next call creates a new one."""
+    global _client, _client_pid
+
+    with _client_lock:
+        client, _client, _client_pid = _client, None, None
+    if client is not None:
+        client.close()
+
+
+def _reset_after_fork():
+    global _client, _client_pid, _client_lock
+
+    # the parent's connections belong to the parent, drop them without closing
+    _client, _client_pid, _client_lock = None, None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def find_image(digest: str):
+    """Return a local image stamped with `digest`, or None if there is none."""
+
+    cli = get_docker_client()
+    images = cli.images.list(filters={"label": f"{DIGEST_LABEL}={digest}"})
+
+    return images[0] if images else None
+
+
+def split_tag(tag: str) -> Tuple[str, Optional[str]]:
+    """`(repository, tag)` of an image reference, the colon of a registry port
+    (`localhost:5000/app`) does not start a tag."""
+    repository, _, name = tag.rpartition(":")
+    if not repository or "/" in name:
+        return tag, None
+    return repository, name
+
+
+def build_image(digest: str, tag: str, force: bool = False, **kwargs):
+    """Build an image stamped with `digest`, reusing a local image with the same
+    digest unless `force`."""
+
+    if not force:
+        image = find_image(digest)
+        if image is not None:
+            image.tag(*split_tag(tag))
+            return image, []
+
+    cli = get_docker_client()
+    image, logs = cli.images.build(
+        tag=tag, quiet=False, labels={DIGEST_LABEL: digest}, **kwargs
+    )
 
-    return docker.client.from_env()
+    return image, logs
 
 
 def login(username: str, registry: str, password: Optional[str] = None, **kwargs):
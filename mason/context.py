@@ -0,0 +1,135 @@
+import glob
+import io
+import json
+import os
+import shlex
+import tarfile
+import tempfile
+from dataclasses import dataclass
+from typing import *
+
+__all__ = [
+    "BuildContext",
+    "build_context",
+    "context_sources",
+    "dockerignore",
+    "hash_sources",
+]
+
+# contexts larger than this are spooled to disk instead of kept in memory
+SPOOL_SIZE = 32 * 1024 * 1024
+
+
+@dataclass
+class BuildContext:
+
+    fileobj: IO[bytes]  # tar stream, rewound
+    files: List[str]  # archive names in the tar
+    size: int  # bytes of the tar stream
+
+
+def context_sources(dockerfile_lines: List[str]) -> List[str]:
+    """Local sources referenced by the `COPY` and `ADD` instructions of a
+    Dockerfile, in order of appearance."""
+    sources = []
+    for line in dockerfile_lines:
+        instruction, _, args = line.strip().partition(" ")
+        if instruction.upper() not in ("COPY", "ADD"):
+            continue
+        args = args.strip()
+        if args.startswith("["):
+            parts = json.loads(args)
+        else:
+            parts = shlex.split(args)
+        flags = [p for p in parts if p.startswith("--")]
+        if any(f.startswith("--from") for f in flags):  # copied from another stage
+            continue
+        for src in (p for p in parts[:-1] if not p.startswith("--")):
+            if "://" in src or src in sources:
+                continue
+            sources.append(src)
+
+    return sources
+
+
+def dockerignore(sources: Iterable[str]) -> str:
+    """`.dockerignore` that excludes everything but `Dockerfile` and `sources`."""
+    lines = ["*", "!Dockerfile"]
+    lines.extend(f"!{os.path.normpath(src)}" for src in sources)
+    return "\n".join(lines) + "\n"
+
+
+def _source_files(match: str) -> Iterator[str]:
+    """`match` itself, or the files below it if it is a directory, sorted."""
+    if not os.path.isdir(match):
+        yield match
+        return
+    for folder, dirs, files in os.walk(match):
+        dirs.sort()
+        for name in sorted(files):
+            yield os.path.join(folder, name)
+
+
+def hash_sources(
+    h: Any,
+    path: str,
+    dockerfile_lines: List[str],
+    skip: Iterable[str] = (),
+):
+    """Update `h` with the names and contents of the `COPY`/`ADD` sources of
+    `dockerfile_lines` found in `path`, but the rendered files in `skip`."""
+    skip = set(skip)
+    for src in context_sources(dockerfile_lines):
+        if src in skip:
+            continue
+        h.update(src.encode("utf-8") + b"\0")
+        for match in sorted(glob.glob(os.path.join(path, src))):
+            for name in _source_files(match):
+                h.update(os.path.relpath(name, path).encode("utf-8") + b"\0")
+                with open(name, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        h.update(chunk)
+                h.update(b"\0")
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, content: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(content)
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(content))
+
+
+def build_context(
+    path: str, files: Dict[str, Union[str, bytes]], dockerfile_lines: List[str]
+) -> BuildContext:
+    """Assemble a minimal build context as a spooled tar stream.
+
+    It holds the in-memory `files` (e.g. the rendered Dockerfile and main file)
+    plus the `COPY`/`ADD` sources of `dockerfile_lines`, read relative to `path`.
+    """
+    fileobj = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    names = []
+    with tarfile.open(fileobj=fileobj, mode="w") as tar:
+        for name, content in files.items():
+            if isinstance(content, str):
+                content = content.encode("utf-8")
+            _add_bytes(tar, name, content)
+            names.append(name)
+
+        for src in context_sources(dockerfile_lines):
+            if src in files:
+                continue
+            matches = sorted(glob.glob(os.path.join(path, src)))
+            if not matches:
+                raise FileNotFoundError(
+                    f"Build context source {src} does not exist in {path}."
+                )
+            for match in matches:
+                name = os.path.relpath(match, path)
+                tar.add(match, arcname=name)
+                names.append(name)
+
+    size = fileobj.tell()
+    fileobj.seek(0)
+
+    return BuildContext(fileobj, names, size)
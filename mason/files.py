@@ -0,0 +1,57 @@
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import *
+
+__all__ = ["SaveReport", "write_if_changed"]
+
+
+@dataclass
+class SaveReport:
+
+    path: str  # folder the files were saved to
+    written: List[str] = field(default_factory=list)  # files whose content changed
+    unchanged: List[str] = field(default_factory=list)  # files left untouched
+    removed: List[str] = field(default_factory=list)  # stale files deleted
+
+    @property
+    def changed(self) -> bool:
+        return len(self.written) > 0 or len(self.removed) > 0
+
+
+def _file_digest(path: str) -> Optional[str]:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def write_if_changed(path: str, content: Union[str, bytes]) -> bool:
+    """Atomically write `content` to `path` unless the file already holds it.
+
+    The content goes to a temp file in the same folder which is then renamed
+    into place, so readers never see a half written file. Returns whether the
+    file was written.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    if _file_digest(path) == hashlib.sha256(content).hexdigest():
+        return False
+
+    folder, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix=f".{name}.", dir=folder or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        mode = os.stat(path).st_mode if os.path.exists(path) else 0o644
+        os.chmod(tmp, mode & 0o777)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+    return True
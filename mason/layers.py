@@ -0,0 +1,171 @@
+import hashlib
+import inspect
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import *
+
+from .buildkit import buildkit_image, uses_buildkit
+from .client import build_image
+from .context import build_context, hash_sources
+from .optimize import optimize_dockerfile
+
+__all__ = ["build_layered"]
+
+
+def _digest(lines: List[str], path: str) -> str:
+    h = hashlib.sha256("\n".join(lines).encode("utf-8"))
+    hash_sources(h, path, lines)
+    return h.hexdigest()
+
+
+def _layer_classes(jar_cls: type) -> List[type]:
+    """Jar classes in the MRO of `jar_cls` (root first) that define their own
+    `setup_image`."""
+    return [
+        c
+        for c in reversed(jar_cls.__mro__)
+        if "setup_image" in vars(c) and hasattr(c, "base_image")
+    ]
+
+
+def _setup_lines(jar) -> List[str]:
+    """Dockerfile lines emitted by `setup_image`, without `FROM` and `COPY
+    main.py`."""
+    return jar.dockerfile_lines[1 : jar._setup_end]
+
+
+class _Layer:
+    """_Layer:
+    an intermediate image holding everything `setup_image` of one jar class
+    emits, built `FROM` the image of its parent layer. Its `COPY`/`ADD` sources
+    are read from `path`, the folder of the jar that requested it.
+    """
+
+    def __init__(self, jar, parent: Optional["_Layer"], path: str):
+        self.jar = jar
+        self.parent = parent
+        self.path = path
+        self.depth = parent.depth + 1 if parent else 0
+        self.base_image = parent.base_image if parent else jar.base_image
+        self.setup_lines = _setup_lines(jar)
+        delta = self.setup_lines[len(parent.setup_lines) if parent else 0 :]
+        if jar.optimize_layers:
+            delta = optimize_dockerfile(delta)
+        self.dockerfile_lines = [f"FROM {parent.tag if parent else jar.base_image}"]
+        self.dockerfile_lines += delta
+        self.digest = _digest(self.dockerfile_lines, path)
+        self.tag = f"mason-layer-{jar.container_name}:{self.digest[:12]}"
+
+    def extended_by(self, jar) -> bool:
+        """Whether `jar` starts from the same base image and setup lines."""
+        setup_lines = _setup_lines(jar)
+        return (
+            jar.base_image == self.base_image
+            and setup_lines[: len(self.setup_lines)] == self.setup_lines
+        )
+
+
+def _ancestor(cls: type, jar):
+    """Instantiate ancestor `cls` of `jar` with the kwargs its `setup_image`
+    accepts."""
+    kwargs = jar._setup_kwargs
+    argspec = inspect.getfullargspec(cls.setup_image)
+    if argspec.varkw is None:
+        kwargs = {k: v for k, v in kwargs.items() if k in argspec.args}
+
+    return cls(root=os.path.dirname(jar.path), py3=jar.python == "python3", **kwargs)
+
+
+def _plan(jar, layers: Dict[str, _Layer]) -> Optional[_Layer]:
+    """Register the ancestor layers of `jar` in `layers` and return the one its
+    final image should start `FROM`, if any."""
+    parent = None
+    for cls in _layer_classes(type(jar)):
+        if cls is type(jar):  # the jar's own delta goes into its final image
+            break
+        ancestor = _ancestor(cls, jar)
+        if parent is not None and not parent.extended_by(ancestor):
+            parent = None
+        layer = _Layer(ancestor, parent, jar.path)
+        parent = layers.setdefault(layer.digest, layer)
+
+    if parent is not None and not parent.extended_by(jar):
+        parent = None
+
+    return parent
+
+
+def _build(
+    digest: str,
+    tag: str,
+    path: str,
+    lines: List[str],
+    files: Dict[str, Union[str, bytes]],
+    force: bool,
+):
+    files = {"Dockerfile": "\n".join(lines), **files}
+    context = build_context(path, files, lines)
+    if uses_buildkit(lines):
+        return buildkit_image(digest, tag, context.fileobj, force=force)
+
+    return build_image(
+        digest, tag, force=force, fileobj=context.fileobj, custom_context=True
+    )
+
+
+def _build_layer(layer: _Layer, parent: Optional[Future], force: bool):
+    if parent is not None:
+        parent.result()
+
+    return _build(
+        layer.digest, layer.tag, layer.path, layer.dockerfile_lines, {}, force
+    )
+
+
+def _build_jar(jar, layer: Optional[_Layer], parent: Optional[Future], force: bool):
+    if layer is None:
+        return jar.build(force=force)
+
+    parent.result()
+    with jar._rendering():
+        delta = jar._source_lines()[1 + len(layer.setup_lines) :]
+        if jar.optimize_layers:
+            delta = optimize_dockerfile(delta, keep_last=jar._main_lines())
+        lines = [f"FROM {layer.tag}"] + delta
+
+        return _build(
+            jar.digest, jar.container_name, jar.path, lines, jar._context_files(), force
+        )
+
+
+def build_layered(jars: Iterable, max_workers: int = 4, force: bool = False):
+    """Build `jars` as a graph of images that mirrors their class hierarchy.
+
+    Every ancestor class with its own `setup_image` is built once as an
+    intermediate image, each jar then starts `FROM` its parent's image and only
+    adds its own delta. Independent layers are built concurrently on a pool of
+    `max_workers` threads. Returns `(image, logs)` per
+    jar, in order.
+    """
+    jars = list(jars)
+    if any(jar.builder_lines for jar in jars):
+        raise ValueError("Jars with a builder stage can not be built layered.")
+    layers: Dict[str, _Layer] = {}
+    plans = [_plan(jar, layers) for jar in jars]
+
+    futures: Dict[str, Future] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # parents are submitted before children, so a running task only ever
+        # waits on tasks that have already been picked up by other workers
+        for layer in sorted(layers.values(), key=lambda l: l.depth):
+            parent = futures[layer.parent.digest] if layer.parent else None
+            futures[layer.digest] = pool.submit(_build_layer, layer, parent, force)
+
+        results = [
+            pool.submit(
+                _build_jar, jar, layer, futures[layer.digest] if layer else None, force
+            )
+            for jar, layer in zip(jars, plans)
+        ]
+
+        return [r.result() for r in results]
@@ -0,0 +1,112 @@
+import re
+import shlex
+from dataclasses import dataclass
+from typing import *
+
+__all__ = ["CACHE_BARRIER", "LayerReport", "count_layers", "optimize_dockerfile"]
+
+# Dockerfile comment that stops adjacent instructions from being merged
+CACHE_BARRIER = "# mason: cache barrier"
+
+# package manager commands -> cleanup appended to the `RUN` that invokes all of
+# them. The apt lists are only removed by the `RUN` that fetched them, a later
+# `apt-get install` without `apt-get update` still needs them
+_CLEANUP = [
+    (("apt-get update", "apt-get install"), "rm -rf /var/lib/apt/lists/*"),
+    (("pip install",), "rm -rf /root/.cache/pip"),
+    (("conda install",), "conda clean -afy"),
+    (("yum install",), "yum clean all"),
+]
+
+_RUN_JOIN = " && \\\n    "
+
+
+@dataclass
+class LayerReport:
+
+    before: int  # layers of the Dockerfile as written
+    after: int  # layers after `optimize_dockerfile`
+
+    @property
+    def saved(self) -> int:
+        return self.before - self.after
+
+
+def count_layers(dockerfile_lines: List[str]) -> int:
+    """Number of filesystem layers the instructions add on top of `FROM`."""
+    return sum(
+        1
+        for line in dockerfile_lines
+        if line.split(" ", 1)[0].upper() in ("RUN", "COPY", "ADD")
+    )
+
+
+def _split(line: str) -> Tuple[str, str]:
+    instruction, _, args = line.partition(" ")
+    return instruction.upper(), args.strip()
+
+
+def _env_pairs(args: str) -> Optional[List[str]]:
+    """`KEY=value` tokens of an `ENV`, None for the legacy `ENV KEY value`."""
+    pairs = shlex.split(args, posix=False)
+    return pairs if all("=" in p for p in pairs) else None
+
+
+def _references(args: str, keys: Set[str]) -> bool:
+    return any(re.search(rf"\$\{{?{re.escape(k)}\b", args) for k in keys)
+
+
+def _with_cleanup(commands: List[str]) -> List[str]:
+    script = " && ".join(commands)
+    for triggers, cleanup in _CLEANUP:
+        if all(t in script for t in triggers) and cleanup not in script:
+            commands = commands + [cleanup]
+            script = " && ".join(commands)
+    return commands
+
+
+def optimize_dockerfile(
+    dockerfile_lines: List[str], keep_last: Iterable[str] = ()
+) -> List[str]:
+    """Coalesce adjacent shell-form `RUN` and `KEY=value` `ENV` instructions,
+    append package manager cache cleanup to every `RUN` and move `keep_last`
+    lines (e.g. `COPY main.py`) to the end, so editing them never invalidates
+    the layers above. `CACHE_BARRIER` lines end a group and are dropped."""
+    keep_last = [line for line in keep_last if line in dockerfile_lines]
+    lines = []
+    group: List[str] = []  # pending `RUN` commands or `ENV` pairs
+    kind = None
+
+    def flush():
+        if kind == "RUN":
+            lines.append("RUN " + _RUN_JOIN.join(_with_cleanup(group)))
+        elif kind == "ENV":
+            lines.append("ENV " + " ".join(group))
+        group.clear()
+
+    for line in dockerfile_lines:
+        if line in keep_last:
+            continue
+        instruction, args = _split(line)
+        if instruction == "RUN" and not args.startswith(("[", "--")):
+            if kind != "RUN":
+                flush()
+                kind = "RUN"
+            group.append(args)
+            continue
+        if instruction == "ENV" and _env_pairs(args) is not None:
+            keys = {p.split("=", 1)[0] for p in group}
+            if kind != "ENV" or _references(args, keys):
+                flush()
+                kind = "ENV"
+            group.extend(_env_pairs(args))
+            continue
+
+        flush()
+        kind = None
+        if line.strip() != CACHE_BARRIER:
+            lines.append(line)
+
+    flush()
+
+    return lines + keep_last
@@ -1,4 +1,11 @@
+import os
 from dataclasses import dataclass
+from typing import *
+
+# how a mirror is mounted at `graph_path` when the jar runs: a read-only or
+# read-write bind mount of `eager_path`, an empty tmpfs, or not at all (None,
+# the default, e.g. when it is copied into the image)
+MOUNT_MODES = ("ro", "rw", "tmpfs", None)
 
 
 @dataclass
@@ -6,3 +13,65 @@ class PathMirror:
 
     eager_path: str  # path used in python dev env
     graph_path: str  # actual path in the container
+    mode: Optional[str] = None  # one of `MOUNT_MODES`
+
+    def __post_init__(self):
+        if self.mode not in MOUNT_MODES:
+            raise ValueError(
+                f"Unknown mount mode {self.mode!r}, use one of {MOUNT_MODES}."
+            )
+        # docker only mounts at absolute container paths
+        if self.mode is not None and not os.path.isabs(self.graph_path):
+            raise ValueError(
+                f"Can not mount at relative graph path {self.graph_path!r}, "
+                "use an absolute path or no mode."
+            )
+
+    @property
+    def mounted(self) -> bool:
+        return self.mode is not None
+
+    @property
+    def bound(self) -> bool:
+        """Whether `eager_path` is bind mounted."""
+        return self.mode in ("ro", "rw")
+
+    def host_path(self, root: str) -> str:
+        """`eager_path`, resolved against `root` if relative."""
+        return os.path.abspath(os.path.join(root, self.eager_path))
+
+
+def run_options(mirrors: Iterable[PathMirror], root: str = ".") -> Dict[str, Any]:
+    """`volumes` and `tmpfs` arguments of `containers.run` mounting `mirrors`,
+    relative eager paths are resolved against `root`."""
+    volumes, tmpfs = {}, {}
+    for mirror in mirrors:
+        if not mirror.mounted:
+            continue
+        if mirror.mode == "tmpfs":
+            tmpfs[mirror.graph_path] = ""
+        else:
+            volumes[mirror.host_path(root)] = {
+                "bind": mirror.graph_path,
+                "mode": mirror.mode,
+            }
+
+    options: Dict[str, Any] = {}
+    if volumes:
+        options["volumes"] = volumes
+    if tmpfs:
+        options["tmpfs"] = tmpfs
+    return options
+
+
+def host_config(options: Dict[str, Any]) -> Dict[str, Any]:
+    """`HostConfig` of the docker API for `run_options`, for aiodocker."""
+    config: Dict[str, Any] = {}
+    if "volumes" in options:
+        config["Binds"] = [
+            f"{host}:{bind['bind']}:{bind['mode']}"
+            for host, bind in options["volumes"].items()
+        ]
+    if "tmpfs" in options:
+        config["Tmpfs"] = options["tmpfs"]
+    return config
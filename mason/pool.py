@@ -0,0 +1,160 @@
+import atexit
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+from typing import *
+
+from .client import get_docker_client
+from .trace import WORKER_FLAG
+
+__all__ = ["ContainerPool"]
+
+_STDOUT, _STDERR = 1, 2
+
+
+class _Worker:
+    """_Worker:
+    one long lived container running `main.py` in worker mode, talking json
+    lines over its attached (multiplexed) stdin/stdout stream.
+    """
+
+    def __init__(self, container):
+        self.container = container
+        self.socket = container.attach_socket(
+            params={"stdin": 1, "stdout": 1, "stderr": 1, "stream": 1}
+        )
+        # docker-py wraps the raw socket in a `SocketIO`
+        self._sock = getattr(self.socket, "_sock", self.socket)
+        self._stdout = b""
+        self._stderr = b""
+
+    def _recv(self, size: int, deadline: Optional[float]) -> bytes:
+        data = b""
+        while len(data) < size:
+            if deadline is not None:
+                self._sock.settimeout(max(deadline - time.monotonic(), 0.001))
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise RuntimeError(
+                    f"Worker container {self.container.id} exited: {self._stderr}"
+                )
+            data += chunk
+        return data
+
+    def call(
+        self, kwargs: Dict[str, Any], timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._sock.sendall(json.dumps(kwargs).encode("utf-8") + b"\n")
+        try:
+            while b"\n" not in self._stdout:
+                stream, size = struct.unpack(">BxxxL", self._recv(8, deadline))
+                payload = self._recv(size, deadline)
+                if stream == _STDOUT:
+                    self._stdout += payload
+                elif stream == _STDERR:
+                    self._stderr += payload
+        except socket.timeout:
+            raise TimeoutError(
+                f"Worker container {self.container.id} still running after "
+                f"{timeout}s."
+            ) from None
+
+        line, _, self._stdout = self._stdout.partition(b"\n")
+        result = json.loads(line)
+        result["stderr"] = self._stderr.decode("utf-8", errors="replace")
+        self._stderr = b""
+
+        return result
+
+    def close(self):
+        try:
+            self.socket.close()
+        finally:
+            self.container.remove(force=True)
+
+
+class ContainerPool:
+    """ContainerPool:
+    keep `size` containers of a jar's image alive and dispatch entrypoint calls
+    to whichever is free, so repeated runs skip container creation and
+    interpreter startup. Kwargs are sent as json, not through `argparse`.
+
+    Thread safe. Use as a context manager or call `close`, pools still open at
+    interpreter exit are torn down then. Calls running longer than the jar's
+    `run_timeout` raise `TimeoutError`, a worker whose call timed out or whose
+    stream broke is removed and replaced by a fresh container.
+    """
+
+    def __init__(self, jar, size: int = 2, **kwargs):
+        self.jar = jar
+        self._free: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._run_kwargs = kwargs
+        self.closed = False
+        try:
+            for _ in range(size):
+                self._free.put(self._start())
+        except BaseException:
+            self.close()
+            raise
+        atexit.register(self.close)
+
+    def _start(self) -> _Worker:
+        container = get_docker_client().containers.run(
+            self.jar.container_name,
+            command=f"{self.jar.python} /entrypoint/main.py {WORKER_FLAG}",
+            stdin_open=True,
+            detach=True,
+            **self._run_kwargs,
+        )
+        worker = _Worker(container)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def _replace(self, worker: _Worker):
+        with self._lock:
+            self._workers.remove(worker)
+        try:
+            worker.close()
+        except Exception:
+            pass  # the container may already be gone
+        if not self.closed:
+            self._free.put(self._start())
+
+    def call(self, **kwargs) -> Dict[str, Any]:
+        """Run `entrypoint(**kwargs)` on a free worker, returns its `stdout`,
+        `stderr` and `error` (a traceback) if it raised."""
+        if self.closed:
+            raise ValueError("Container pool is closed.")
+        worker = self._free.get()
+        try:
+            result = worker.call(kwargs, self.jar.run_timeout)
+        except BaseException:
+            # the stream is out of sync or the container is gone
+            self._replace(worker)
+            raise
+        self._free.put(worker)
+        return result
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+        atexit.unregister(self.close)
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
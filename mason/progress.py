@@ -0,0 +1,174 @@
+import re
+import time
+from dataclasses import dataclass, field, replace
+from typing import *
+
+from .client import DIGEST_LABEL, find_image, get_docker_client, split_tag
+
+__all__ = ["BuildStep", "BuildEvent", "BuildSummary", "BuildStream"]
+
+_STEP = re.compile(r"^Step (\d+)/(\d+) : (.*)$", re.DOTALL)
+_BUILT = re.compile(r"^Successfully built ([0-9a-f]+)")
+
+
+@dataclass
+class BuildStep:
+
+    number: int  # 1-based Dockerfile step
+    total: int
+    instruction: str  # instruction as echoed by the daemon
+    line: Optional[str]  # matching entry of `Jar.dockerfile_lines`
+    cached: bool = False
+    elapsed: float = 0.0  # seconds
+    bytes: int = 0  # bytes pulled during the step
+    started: float = field(default=0.0, repr=False)
+
+
+@dataclass
+class BuildEvent:
+
+    kind: str  # "start", "log", "progress" or "end" of `step`
+    step: BuildStep  # snapshot of the step when the event was emitted
+    message: str = ""
+
+
+@dataclass
+class BuildSummary:
+
+    image: Any
+    steps: List[BuildStep]
+    elapsed: float  # seconds, wall time of the whole build
+    cached: bool = False  # whether an image with the same digest was reused
+    context_size: int = 0  # bytes of the build context sent to the daemon
+
+    def slowest(self, n: int = 5, instruction: str = "RUN") -> List[BuildStep]:
+        """The `n` steps of `instruction` that took longest."""
+        steps = [s for s in self.steps if s.instruction.startswith(instruction)]
+        return sorted(steps, key=lambda s: s.elapsed, reverse=True)[:n]
+
+    def __str__(self):
+        lines = [f"built in {self.elapsed:.1f}s" + (" (cached)" if self.cached else "")]
+        if self.context_size:
+            lines.append(f"  build context: {self.context_size} bytes")
+        for step in self.slowest():
+            share = step.elapsed / self.elapsed if self.elapsed > 0 else 0.0
+            lines.append(
+                f"  {step.elapsed:8.1f}s {share:6.1%}  step {step.number}: "
+                f"{step.line or step.instruction}"
+            )
+        return "\n".join(lines)
+
+
+class StepTracker:
+    """StepTracker:
+    turn the json chunks of a daemon build stream into `BuildEvent`s, keeping
+    per step timings in `steps`.
+    """
+
+    def __init__(self, tag: str, dockerfile_lines: List[str]):
+        self.tag = tag
+        # comments do not show up as build steps
+        self.dockerfile_lines = [
+            line for line in dockerfile_lines if not line.lstrip().startswith("#")
+        ]
+        self.steps: List[BuildStep] = []
+        self.image_id: Optional[str] = None
+        self._pulled: Dict[str, int] = {}
+
+    def _step(self, match: Match, now: float) -> BuildStep:
+        number, total = int(match.group(1)), int(match.group(2))
+        line = None
+        if len(self.dockerfile_lines) == total:
+            line = self.dockerfile_lines[number - 1]
+        return BuildStep(number, total, match.group(3).strip(), line, started=now)
+
+    def feed(self, chunk: Dict[str, Any], now: float) -> Iterator[BuildEvent]:
+        if "error" in chunk:
+            raise RuntimeError(f"Build of {self.tag} failed: {chunk['error']}")
+        if "aux" in chunk:
+            self.image_id = chunk["aux"].get("ID", self.image_id)
+            return
+
+        text = chunk.get("stream", "")
+        match = _STEP.match(text)
+        if match:
+            yield from self.finish(now)
+            self.steps.append(self._step(match, now))
+            self._pulled.clear()
+            yield BuildEvent("start", replace(self.steps[-1]), text)
+            return
+
+        built = _BUILT.match(text)
+        if built and self.image_id is None:
+            self.image_id = built.group(1)
+        if not self.steps:
+            return
+
+        step = self.steps[-1]
+        step.elapsed = now - step.started
+        if chunk.get("id") and "progressDetail" in chunk:
+            self._pulled[chunk["id"]] = chunk["progressDetail"].get("current", 0)
+            step.bytes = sum(self._pulled.values())
+            yield BuildEvent("progress", replace(step), chunk.get("status", ""))
+            return
+        if text.strip() == "---> Using cache":
+            step.cached = True
+        yield BuildEvent("log", replace(step), text or chunk.get("status", ""))
+
+    def finish(self, now: float) -> Iterator[BuildEvent]:
+        """End the current step, if any."""
+        if self.steps:
+            self.steps[-1].elapsed = now - self.steps[-1].started
+            yield BuildEvent("end", replace(self.steps[-1]))
+
+
+class BuildStream:
+    """BuildStream:
+    iterate over the `BuildEvent`s of a build driven through the low level
+    docker API. Once exhausted, `summary` holds per step timings and the built
+    image.
+
+    A local image stamped with the same `digest` is reused unless `force`, in
+    which case no events are emitted.
+    """
+
+    def __init__(
+        self,
+        digest: str,
+        tag: str,
+        dockerfile_lines: List[str],
+        force: bool = False,
+        context_size: int = 0,
+        **kwargs,
+    ):
+        self.digest = digest
+        self.tag = tag
+        self.dockerfile_lines = dockerfile_lines
+        self.force = force
+        self.context_size = context_size
+        self.kwargs = kwargs
+        self.summary: Optional[BuildSummary] = None
+
+    def __iter__(self) -> Iterator[BuildEvent]:
+        start = time.perf_counter()
+
+        image = None if self.force else find_image(self.digest)
+        if image is not None:
+            image.tag(*split_tag(self.tag))
+            self.summary = BuildSummary(image, [], 0.0, cached=True)
+            return
+
+        cli = get_docker_client()
+        tracker = StepTracker(self.tag, self.dockerfile_lines)
+        for chunk in cli.api.build(
+            tag=self.tag, labels={DIGEST_LABEL: self.digest}, decode=True, **self.kwargs
+        ):
+            yield from tracker.feed(chunk, time.perf_counter())
+
+        now = time.perf_counter()
+        yield from tracker.finish(now)
+
+        image = cli.images.get(tracker.image_id) if tracker.image_id else None
+        self.summary = BuildSummary(
+            image, tracker.steps, now - start, False, self.context_size
+        )
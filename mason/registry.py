@@ -0,0 +1,212 @@
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import *
+
+from .client import get_docker_client
+
+__all__ = ["PushProgress", "PushResult", "PushReport", "push_many"]
+
+
+@dataclass
+class PushProgress:
+
+    tag: str
+    layers: int  # layers seen so far
+    done: int  # layers pushed or already in the registry
+    bytes: int  # bytes uploaded so far
+    total: int  # bytes to upload, as far as known
+
+
+@dataclass
+class PushResult:
+
+    tag: str
+    logs: List[dict] = field(default_factory=list)
+    attempts: int = 0
+    bytes: int = 0  # bytes uploaded by the successful attempt
+    skipped: int = 0  # layers the registry already had
+    elapsed: float = 0.0  # seconds, including retries
+    error: Optional[str] = None  # last error if every attempt failed
+
+
+@dataclass
+class PushReport:
+
+    results: List[PushResult]
+    elapsed: float  # seconds, wall time of all pushes
+
+    @property
+    def bytes(self) -> int:
+        return sum(r.bytes for r in self.results)
+
+    @property
+    def throughput(self) -> float:
+        """Uploaded MB per second."""
+        return self.bytes / 1e6 / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def failed(self) -> List[PushResult]:
+        return [r for r in self.results if r.error is not None]
+
+    def __str__(self):
+        return (
+            f"pushed {len(self.results) - len(self.failed)}/{len(self.results)} "
+            f"images, {self.bytes / 1e6:.1f} MB in {self.elapsed:.1f}s "
+            f"({self.throughput:.1f} MB/s)"
+        )
+
+
+# errors of a push stream that another attempt would not fix
+_PERMANENT = re.compile(
+    r"unauthorized|denied|authentication required|does not exist|not found", re.I
+)
+
+
+class _StreamError(RuntimeError):
+    """Error chunk of a daemon push stream."""
+
+
+def _transient(error: Exception) -> bool:
+    """Whether a failed push is worth retrying: registry or daemon server errors
+    and dropped connections, not auth failures, missing tags or bugs."""
+    if isinstance(error, _StreamError):
+        return not _PERMANENT.search(str(error))
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    try:
+        import docker.errors
+        import requests.exceptions
+    except ImportError:
+        return False
+    if isinstance(error, docker.errors.APIError):
+        return error.is_server_error()
+    return isinstance(
+        error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+    )
+
+
+class PushTracker:
+    """PushTracker:
+    condense the per layer json chunks of a daemon push stream into one
+    `PushProgress` per update.
+    """
+
+    def __init__(self, tag: str):
+        self.tag = tag
+        self.skipped = 0
+        self._sent: Dict[str, int] = {}
+        self._sizes: Dict[str, int] = {}
+        self._done: Set[str] = set()
+
+    @property
+    def bytes(self) -> int:
+        return sum(self._sent.values())
+
+    def feed(self, chunk: Dict[str, Any]) -> Optional[PushProgress]:
+        if "error" in chunk:
+            raise _StreamError(chunk["error"])
+
+        layer, status = chunk.get("id"), chunk.get("status", "")
+        finished = status in ("Pushed", "Layer already exists")
+        if layer is None or not (finished or "progressDetail" in chunk):
+            return None
+        detail = chunk.get("progressDetail") or {}
+        self._sent[layer] = detail.get("current", self._sent.get(layer, 0))
+        self._sizes[layer] = detail.get("total", self._sizes.get(layer, 0))
+        if status == "Layer already exists":
+            self.skipped += 1
+        if finished:
+            self._done.add(layer)
+
+        return PushProgress(
+            self.tag,
+            len(self._sent),
+            len(self._done),
+            self.bytes,
+            sum(self._sizes.values()),
+        )
+
+
+def _push_once(
+    tag: str, result: PushResult, progress: Optional[Callable[[PushProgress], None]]
+):
+    """Push `tag` once, reporting condensed progress to `progress`."""
+    cli = get_docker_client()
+    tracker = PushTracker(tag)
+    result.logs = []
+    for chunk in cli.images.push(tag, stream=True, decode=True):
+        result.logs.append(chunk)
+        update = tracker.feed(chunk)
+        if update is not None and progress is not None:
+            progress(update)
+
+    result.bytes, result.skipped = tracker.bytes, tracker.skipped
+
+
+def _push(
+    tag: str,
+    after: List[Future],
+    retries: int,
+    backoff: float,
+    progress: Optional[Callable[[PushProgress], None]],
+) -> PushResult:
+    # let the pushes uploading layers shared with this one finish first, so the
+    # registry already has them and each layer is uploaded only once
+    wait(after)
+
+    start = time.perf_counter()
+    result = PushResult(tag)
+    for attempt in range(retries + 1):
+        result.attempts = attempt + 1
+        try:
+            _push_once(tag, result, progress)
+            result.error = None
+            break
+        except Exception as e:
+            result.error = str(e)
+            if not _transient(e):
+                break
+            if attempt < retries:
+                time.sleep(backoff * 2 ** attempt)
+    result.elapsed = time.perf_counter() - start
+
+    return result
+
+
+def push_many(
+    jars: Iterable,
+    max_workers: int = 4,
+    retries: int = 3,
+    backoff: float = 1.0,
+    progress: Optional[Callable[[PushProgress], None]] = None,
+) -> PushReport:
+    """Push the images of logged in `jars` concurrently.
+
+    An image waits for the earlier pushes that first upload any of its layers,
+    so layers shared between jars are uploaded once. Pushes failing with server
+    errors or dropped connections are retried `retries` times with exponential
+    `backoff` (seconds). `progress`, if given, receives one condensed
+    `PushProgress` per layer update.
+    """
+    start = time.perf_counter()
+    tags, layers = [], []
+    for jar in jars:
+        tag, image = jar._tag_for_registry()
+        tags.append(tag)
+        layers.append(set(image.attrs.get("RootFS", {}).get("Layers", [])))
+
+    owners: Dict[str, int] = {}  # layer -> index of the first push uploading it
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures: List[Future] = []
+        for i, tag in enumerate(tags):
+            # owners are submitted first, so a push only ever waits on pushes
+            # already picked up by other workers
+            after = {owners.setdefault(layer, i) for layer in layers[i]} - {i}
+            after = [futures[j] for j in sorted(after)]
+            futures.append(pool.submit(_push, tag, after, retries, backoff, progress))
+
+        results = [f.result() for f in futures]
+
+    return PushReport(results, time.perf_counter() - start)
@@ -0,0 +1,214 @@
+import codecs
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from typing import *
+
+from .client import get_docker_client
+
+__all__ = ["RunResult", "RunHandle"]
+
+# where a `RunHandle` streams container output: `output(stream, text)` with
+# stream "stdout" or "stderr", a text file object or a file path
+Output = Union[Callable[[str, str], None], IO[str], str]
+
+
+@dataclass
+class RunResult:
+
+    kwargs: Dict[str, Any]  # entrypoint kwargs of the run
+    exit_code: int
+    stdout: str
+    stderr: str
+    elapsed: float  # seconds, wall time of the run
+    index: int = 0  # position of `kwargs` in the `run_many` input
+    cpu_time: Optional[float] = None  # seconds of CPU the container used
+    max_memory: Optional[int] = None  # bytes, highest memory usage sampled
+
+
+def run_container(image: str, command: str, **kwargs) -> Tuple[int, str, str]:
+    """Run `command` in a fresh container of `image` until it exits, returns
+    `(exit code, stdout, stderr)`. The container is removed afterwards."""
+    cli = get_docker_client()
+    container = cli.containers.run(image, command=command, detach=True, **kwargs)
+    try:
+        exit_code = container.wait()["StatusCode"]
+        stdout = container.logs(stdout=True, stderr=False)
+        stderr = container.logs(stdout=False, stderr=True)
+    finally:
+        container.remove(force=True)
+
+    return exit_code, stdout.decode(), stderr.decode()
+
+
+def echo(stream: str, text: str):
+    """`Output` printing to the stdout or stderr of this process."""
+    print(
+        text, end="", file=sys.stderr if stream == "stderr" else sys.stdout, flush=True
+    )
+
+
+def _writer(
+    output: Optional[Output], kept: Dict[str, List[str]]
+) -> Tuple[Callable[[str, str], None], Callable[[], None]]:
+    """`(write(stream, text), close())` of `output`, None keeps text in `kept`."""
+    if output is None:
+        return lambda stream, text: kept[stream].append(text), lambda: None
+    if callable(output):
+        return output, lambda: None
+    if isinstance(output, str):
+        f = open(output, "w")
+        return lambda stream, text: f.write(text), f.close
+    return lambda stream, text: output.write(text), output.flush
+
+
+class RunHandle:
+    """RunHandle:
+    a detached container, see `Jar.start`. Its stdout and stderr are streamed to
+    `output` as they are written, or kept in memory for the `RunResult` when
+    there is none. Memory and CPU usage are sampled while it runs.
+
+    `wait` returns the `RunResult` once the container exits and removes it
+    (unless not `remove`).
+    """
+
+    def __init__(
+        self,
+        container: Any,
+        kwargs: Dict[str, Any],
+        output: Optional[Output] = None,
+        remove: bool = True,
+    ):
+        self.container = container
+        self.kwargs = kwargs
+        self.remove = remove
+        self._kept: Dict[str, List[str]] = {"stdout": [], "stderr": []}
+        self._write, self._close = _writer(output, self._kept)
+        self._start = time.perf_counter()
+        self._end: Optional[float] = None
+        self._error: Optional[BaseException] = None
+        self._cpu_time: Optional[float] = None
+        self._max_memory: Optional[int] = None
+        self._result: Optional[RunResult] = None
+        self._streamer = threading.Thread(target=self._stream, daemon=True)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._streamer.start()
+        self._sampler.start()
+
+    def _stream(self):
+        decoders = {
+            name: codecs.getincrementaldecoder("utf-8")("replace")
+            for name in self._kept
+        }
+        try:
+            for chunks in self.container.attach(
+                stdout=True, stderr=True, stream=True, logs=True, demux=True
+            ):
+                for name, chunk in zip(("stdout", "stderr"), chunks):
+                    text = decoders[name].decode(chunk) if chunk else ""
+                    if text:
+                        self._write(name, text)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._end = time.perf_counter()
+            self._close()
+
+    def _sample(self):
+        try:
+            for stats in self.container.stats(stream=True, decode=True):
+                memory = stats.get("memory_stats", {}).get("usage")
+                cpu = stats.get("cpu_stats", {}).get("cpu_usage", {})
+                if memory:
+                    self._max_memory = max(self._max_memory or 0, memory)
+                if cpu.get("total_usage"):
+                    self._cpu_time = cpu["total_usage"] / 1e9
+        except Exception:  # usage is best effort, the container may be gone
+            pass
+
+    @property
+    def running(self) -> bool:
+        return self._streamer.is_alive()
+
+    def kill(self):
+        self.container.kill()
+
+    def wait(self, timeout: Optional[float] = None) -> RunResult:
+        """Wait for the container to exit. Raises `TimeoutError`, leaving it
+        running, when it did not within `timeout` seconds."""
+        if self._result is not None:
+            return self._result
+
+        self._streamer.join(timeout)
+        if self._streamer.is_alive():
+            raise TimeoutError(
+                f"Container {self.container.id} still running after {timeout}s."
+            )
+        try:
+            exit_code = self.container.wait()["StatusCode"]
+            # the stats stream ends with the container
+            self._sampler.join(1.0)
+        finally:
+            if self.remove:
+                self.container.remove(force=True)
+        if self._error is not None:
+            raise self._error
+
+        self._result = RunResult(
+            self.kwargs,
+            exit_code,
+            "".join(self._kept["stdout"]),
+            "".join(self._kept["stderr"]),
+            self._end - self._start,
+            cpu_time=self._cpu_time,
+            max_memory=self._max_memory,
+        )
+        return self._result
+
+
+def start_container(
+    image: str,
+    command: str,
+    kwargs: Dict[str, Any],
+    output: Optional[Output] = None,
+    **run_kwargs,
+) -> RunHandle:
+    """Start `command` in a fresh, detached container of `image`."""
+    cli = get_docker_client()
+    container = cli.containers.run(image, command=command, detach=True, **run_kwargs)
+
+    return RunHandle(container, kwargs, output)
+
+
+# namespace of the main file loaded in a `Jar.map` worker process
+_main: Dict[str, Any] = {}
+
+
+def load_main(
+    mainfile: str, path_dict: Dict[str, str], main_path: Optional[str] = None
+):
+    """Process pool initializer: execute the rendered main file as a module,
+    with the eager paths in place of the container ones. Sidecar files are
+    looked up next to `main_path`."""
+    _main.clear()
+    _main["__name__"] = "__mason_main__"
+    if main_path is not None:
+        _main["__file__"] = main_path
+    exec(compile(mainfile, "main.py", "exec"), _main)
+    _main["path_dict"].update(path_dict)
+
+
+def call_main(kwargs: Dict[str, Any]) -> Any:
+    return _main["entrypoint"](**kwargs)
+
+
+def timed(
+    index: int, kwargs: Dict[str, Any], run: Callable[[], Tuple[int, str, str]]
+) -> RunResult:
+    start = time.perf_counter()
+    exit_code, stdout, stderr = run()
+
+    return RunResult(
+        kwargs, exit_code, stdout, stderr, time.perf_counter() - start, index
+    )
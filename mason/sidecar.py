@@ -0,0 +1,141 @@
+import hashlib
+import io
+import pickle
+import re
+import sys
+from dataclasses import dataclass, field
+from typing import *
+
+__all__ = [
+    "Sidecar",
+    "SIDECAR_DIR",
+    "SIDECAR_NAME",
+    "SIDECAR_LOADER",
+    "render_constant",
+]
+
+# mason owned folder next to `main.py` holding the sidecar files, locally and in
+# the image
+SIDECAR_DIR = ".mason_sidecars"
+
+# `<constant name>-<content hash>.<npy|pkl>`, see `render_constant`
+SIDECAR_NAME = re.compile(r"^[A-Za-z_]\w*-[0-9a-f]{12}\.(npy|pkl)$")
+
+# sidecar constants are bound to a proxy loading the file on first use, then
+# standing in for the value
+SIDECAR_LOADER = f"""class _MasonSidecar:
+    __slots__ = ('_path', '_value')
+
+    def __init__(self, path):
+        object.__setattr__(self, '_path', path)
+
+    def _mason_value(self):
+        try:
+            return object.__getattribute__(self, '_value')
+        except AttributeError:
+            pass
+        path = object.__getattribute__(self, '_path')
+        if path.endswith('.npy'):
+            import numpy
+            value = numpy.load(path, mmap_mode='r')
+        else:
+            import pickle
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        object.__setattr__(self, '_value', value)
+        return value
+
+    @property
+    def __class__(self):
+        return type(self._mason_value())
+
+    def __getattr__(self, name):
+        return getattr(self._mason_value(), name)
+
+    def __hash__(self):
+        return hash(self._mason_value())
+
+    def __array__(self, *args, **kwargs):
+        import numpy
+        return numpy.asarray(self._mason_value(), *args, **kwargs)
+
+
+def _mason_forward(name):
+    def method(self, *args):
+        return getattr(self._mason_value(), name)(*args)
+    return method
+
+
+for _name in (
+    'repr str bool len iter reversed contains getitem setitem delitem call eq '
+    'ne lt le gt ge add radd sub rsub mul rmul matmul rmatmul truediv '
+    'rtruediv floordiv rfloordiv mod rmod pow rpow neg pos abs invert and '
+    'rand or ror xor rxor int float index reduce_ex'
+).split():
+    setattr(_MasonSidecar, f'__{{_name}}__', _mason_forward(f'__{{_name}}__'))
+
+
+def _mason_sidecar(filename):
+    import os
+    return _MasonSidecar(os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '{SIDECAR_DIR}', filename
+    ))
+
+"""
+
+
+@dataclass
+class Sidecar:
+
+    name: str  # constant name
+    value: Any
+    filename: str  # `<name>-<content hash>.<npy|pkl>`
+    data: Optional[bytes] = field(default=None, repr=False)  # see `payload`
+
+    @property
+    def path(self) -> str:
+        return f"{SIDECAR_DIR}/{self.filename}"
+
+    def payload(self) -> bytes:
+        """File content, serialized once."""
+        if self.data is None:
+            import numpy
+
+            buffer = io.BytesIO()
+            numpy.save(buffer, self.value, allow_pickle=False)
+            self.data = buffer.getvalue()
+
+        return self.data
+
+
+def _ndarray(value: Any) -> bool:
+    # numpy is only ever imported by the user
+    numpy = sys.modules.get("numpy")
+    return (
+        numpy is not None
+        and isinstance(value, numpy.ndarray)
+        and not value.dtype.hasobject
+    )
+
+
+def render_constant(
+    name: str, value: Any, threshold: Optional[int]
+) -> Tuple[str, Optional[Sidecar]]:
+    """`name = <value>` line of the main file. Numpy arrays, and values whose
+    source would be longer than `threshold` characters, are loaded from a
+    `Sidecar` file instead."""
+    if threshold is not None and _ndarray(value):
+        h = hashlib.sha256(f"{value.dtype.str}{value.shape}".encode("utf-8"))
+        h.update(value.tobytes())
+        sidecar = Sidecar(name, value, f"{name}-{h.hexdigest()[:12]}.npy")
+        return f"{name} = _mason_sidecar('{sidecar.filename}')", sidecar
+
+    source = f"'{value}'" if isinstance(value, str) else f"{value}"
+    if threshold is None or len(source) <= threshold:
+        return f"{name} = {source}", None
+
+    # named after the pickled bytes, a repr may be truncated or hold `id()`s
+    data = pickle.dumps(value, protocol=4)
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    sidecar = Sidecar(name, value, f"{name}-{digest}.pkl", data)
+    return f"{name} = _mason_sidecar('{sidecar.filename}')", sidecar
@@ -0,0 +1,190 @@
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import *
+
+__all__ = [
+    "Span",
+    "span",
+    "enable_tracing",
+    "disable_tracing",
+    "tracing_enabled",
+    "add_span_hook",
+    "remove_span_hook",
+    "get_spans",
+    "clear_spans",
+    "export_jsonl",
+    "export_chrome_trace",
+]
+
+# set to a file path to record spans from import and export them at exit, as a
+# chrome trace if the path ends with `.json`, as json lines otherwise
+TRACE_ENV = "MASON_TRACE"
+
+
+@dataclass
+class Span:
+
+    name: str
+    start: float  # seconds, `time.perf_counter`
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    span_id: int = 0
+    parent_id: Optional[int] = None  # enclosing span in the same context
+    pid: int = 0
+    thread_id: int = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.end or self.start) - self.start
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.end = time.perf_counter()
+        if exc[0] is not None:
+            self.attributes["error"] = exc[0].__name__
+        _current.reset(self._token)
+        del self._token
+        _finish(self)
+
+
+class _NoopSpan:
+    """_NoopSpan:
+    stands in for `Span` while tracing is disabled, so instrumented code costs a
+    flag check and two method calls.
+    """
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP = _NoopSpan()
+_enabled = False
+_spans: List[Span] = []
+_hooks: List[Callable[[Span], None]] = []
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_current: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "mason_span", default=None
+)
+
+
+def span(name: str, **attributes) -> Union[Span, _NoopSpan]:
+    """Time a `with` block as a span nested in the current one, `set` adds
+    attributes while it runs. Returns a no-op while tracing is disabled."""
+    if not _enabled:
+        return _NOOP
+    parent = _current.get()
+    return Span(
+        name,
+        time.perf_counter(),
+        attributes=attributes,
+        span_id=next(_ids),
+        parent_id=None if parent is None else parent.span_id,
+        pid=os.getpid(),
+        thread_id=threading.get_ident(),
+    )
+
+
+def _finish(s: Span):
+    with _lock:
+        _spans.append(s)
+        hooks = list(_hooks)
+    for hook in hooks:
+        hook(s)
+
+
+def enable_tracing():
+    global _enabled
+    _enabled = True
+
+
+def disable_tracing():
+    global _enabled
+    _enabled = False
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+def add_span_hook(hook: Callable[[Span], None]):
+    """Call `hook(span)` whenever a span ends, in the thread that ran it."""
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_span_hook(hook: Callable[[Span], None]):
+    with _lock:
+        _hooks.remove(hook)
+
+
+def get_spans() -> List[Span]:
+    """Finished spans in the order they ended."""
+    with _lock:
+        return list(_spans)
+
+
+def clear_spans():
+    with _lock:
+        _spans.clear()
+
+
+def export_jsonl(path: str, spans: Optional[List[Span]] = None):
+    """Write one json object per span."""
+    spans = get_spans() if spans is None else spans
+    with open(path, "w") as f:
+        for s in spans:
+            f.write(json.dumps(dict(asdict(s), duration=s.duration), default=str))
+            f.write("\n")
+
+
+def export_chrome_trace(path: str, spans: Optional[List[Span]] = None):
+    """Write spans as complete events of the Chrome trace event format, viewable
+    in `chrome://tracing` or Perfetto."""
+    spans = get_spans() if spans is None else spans
+    events = [
+        {
+            "name": s.name,
+            "ph": "X",
+            "ts": s.start * 1e6,
+            "dur": s.duration * 1e6,
+            "pid": s.pid,
+            "tid": s.thread_id,
+            "args": {k: str(v) for k, v in s.attributes.items()},
+        }
+        for s in spans
+    ]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def _export_at_exit(path: str):
+    if path.endswith(".json"):
+        export_chrome_trace(path)
+    else:
+        export_jsonl(path)
+
+
+if os.environ.get(TRACE_ENV):
+    enable_tracing()
+    atexit.register(_export_at_exit, os.environ[TRACE_ENV])
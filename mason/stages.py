@@ -0,0 +1,18 @@
+from dataclasses import dataclass
+
+__all__ = ["BUILDER_STAGE", "SizeReport"]
+
+# name of the stage `setup_builder` fills, see `Jar.copy_artifact`
+BUILDER_STAGE = "builder"
+
+
+@dataclass
+class SizeReport:
+
+    builder: int  # bytes of the builder stage image
+    runtime: int  # bytes of the final image
+
+    @property
+    def saved(self) -> int:
+        """Bytes not shipped compared to an image that keeps the builder stage."""
+        return self.builder - self.runtime
@@ -1,12 +1,121 @@
+import ast
 import inspect
+import os
+import textwrap
+import tokenize
+from dataclasses import dataclass
+from types import CodeType, MethodType
 from typing import *
 
-__all__ = ["INDENT", "include", "get_main_source_file", "get_function_source"]
+__all__ = [
+    "INDENT",
+    "WORKER_FLAG",
+    "include",
+    "get_main_source_file",
+    "get_function_source",
+    "defer_import",
+    "MAIN_MODULE",
+    "MAIN_STUB",
+    "LAZY_IMPORT",
+    "get_function_trace",
+    "reachable",
+    "FunctionTrace",
+]
 
 INDENT = 4
 
 _fm = "# frontmatter"
 
+# `main.py <WORKER_FLAG>` serves entrypoint calls over stdin, see `mason.pool`
+WORKER_FLAG = "--mason-worker"
+
+# one json kwargs per stdin line in, one json result per stdout line out
+_WORKER = """def _mason_worker():
+    import contextlib
+    import io
+    import json
+    import sys
+    import traceback
+
+    for line in sys.stdin:
+        out = io.StringIO()
+        result = {}
+        try:
+            with contextlib.redirect_stdout(out):
+                entrypoint(**json.loads(line))
+        except Exception:
+            result['error'] = traceback.format_exc()
+        result['stdout'] = out.getvalue()
+        sys.stdout.write(json.dumps(result) + '\\n')
+        sys.stdout.flush()
+
+"""
+
+# module holding the main file in fast start mode, `main.py` is then `MAIN_STUB`
+MAIN_MODULE = "mason_main"
+
+# scripts are compiled on every start, imported modules load from `__pycache__`
+MAIN_STUB = f"""from {MAIN_MODULE} import _mason_main
+
+_mason_main()
+"""
+
+# modules bound by `_mason_lazy` are executed on first attribute access
+LAZY_IMPORT = """def _mason_lazy(name):
+    import importlib.util
+    import sys
+
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+"""
+
+# `--name value [value ...]` parsing without importing `argparse`, returns None
+# for anything else
+_FAST_PARSE = """def _mason_parse(argv, spec):
+    kwargs = dict.fromkeys(spec)
+    i = 0
+    while i < len(argv):
+        name = argv[i][2:] if argv[i].startswith('--') else None
+        if name not in spec:
+            return None
+        typ, nargs = spec[name]
+        j = i + 1
+        while j < len(argv) and not argv[j].startswith('--'):
+            j += 1
+        try:
+            values = [v if typ is None else typ(v) for v in argv[i + 1 : j]]
+        except ValueError:
+            return None
+        if nargs is None and len(values) == 1:
+            kwargs[name] = values[0]
+        elif nargs is not None and values:
+            kwargs[name] = values
+        else:
+            return None
+        i = j
+    return kwargs
+
+"""
+
+# (code object, name) -> (source file stamp, FunctionTrace)
+_source_cache: Dict[Tuple[CodeType, str], Tuple[Any, "FunctionTrace"]] = {}
+
+# source file -> (stamp, _Source, first line -> function nodes starting there),
+# every module is parsed once however many of its functions are traced
+_module_cache: Dict[str, Tuple[Any, "_Source", Dict[int, List[ast.AST]]]] = {}
+
+# builtins that reach globals by name
+_DYNAMIC = {"globals", "locals", "vars", "eval", "exec"}
+
 
 def _indent(line: str, num_tabs: int = 1) -> str:
     return " " * INDENT * num_tabs + line
@@ -23,45 +132,33 @@ class _IncludeDecorator:
 
     In Jar.entrypoint the method can still be called by original
     name. But the original unwrapped method is preseved as method
-    `_original_<method_name>`.
+    `_original_<method_name>`, registered once per class by
+    `Jar.__init_subclass__`.
     """
 
     def __init__(self, method):
-        self.method = method
-
-    def __get__(self, instance, owner) -> Callable:
-        self.instance = instance
-        if not hasattr(self.method, "__name__"):
+        if not hasattr(method, "__name__"):
             raise AttributeError(
                 "The `include` decorator can only be applied to regular methods."
             )
-        key = self.method.__name__
-        if key not in self.instance._helper_registry:
-            val = f"_original_{key}"
-            self.instance._helper_registry[key] = val
-            setattr(self.instance, val, self.method)
+        self.method = method
 
-        return self.__call__
+    @property
+    def graph_name(self) -> str:
+        return f"_original_{self.method.__name__}"
 
-    def __call__(self, *args, **kwargs) -> Any:
+    def __get__(self, instance, owner) -> Callable:
+        if instance is None:
+            return self
 
-        return self.method(self.instance, *args, **kwargs)
+        return MethodType(self.method, instance)
 
 
 include = _IncludeDecorator  # alias for Include class
 
 
-def get_main_source_file(src: str, argspec: NamedTuple) -> str:
-    ln = []
-    ln.append(src)
-    ln.append("if __name__ == '__main__':")
-    if len(argspec.args) < 2:  # e.g. entrypoint(self)
-        ln.append(_indent("entrypoint()"))
-        return "\n".join(ln)
-
-    ln.append(_indent("import argparse"))
-    ln.append(_indent("parser = argparse.ArgumentParser()"))
-
+def _arguments(argspec: NamedTuple) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """`(name, type name, nargs)` of the entrypoint arguments."""
     for arg in argspec.args:
         if arg in ["self", "cls"]:
             continue
@@ -69,6 +166,7 @@ def get_main_source_file(src: str, argspec: NamedTuple) -> str:
             arg in argspec.annotations
         ), f"Arg {arg} is not annotated. All entrypoint args should be annotated kwargs."
 
+    arguments = []
     for arg, typ in argspec.annotations.items():
         if arg in ("self", "cls"):
             continue
@@ -84,63 +182,382 @@ def get_main_source_file(src: str, argspec: NamedTuple) -> str:
             nargs = None
 
         type_name = typ.__name__ if hasattr(typ, "__name__") else None
-        ln.append(
-            _indent(f"parser.add_argument('--{arg}', type={type_name}, nargs={nargs})")
+        arguments.append((arg, type_name, nargs))
+
+    return arguments
+
+
+def _main_lines(argspec: NamedTuple, fast: bool) -> List[str]:
+    """Body of the main block: serve the worker loop or parse `sys.argv` and
+    call the entrypoint."""
+    ln = []
+    ln.append("import sys")
+    ln.append(f"if sys.argv[1:] == ['{WORKER_FLAG}']:")
+    ln.append(_indent("_mason_worker()"))
+    ln.append(_indent("sys.exit()"))
+    if len(argspec.args) < 2:  # e.g. entrypoint(self)
+        ln.append("entrypoint()")
+        return ln
+
+    arguments = _arguments(argspec)
+    parser = []
+    parser.append("import argparse")
+    parser.append("parser = argparse.ArgumentParser()")
+    for arg, type_name, nargs in arguments:
+        parser.append(
+            f"parser.add_argument('--{arg}', type={type_name}, nargs={nargs})"
         )
-    ln.append(_indent("kwargs = vars(parser.parse_args())"))
-    ln.append(_indent("entrypoint(**kwargs)"))
+    parser.append("kwargs = vars(parser.parse_args())")
+
+    if fast:
+        spec = ", ".join(f"'{a}': ({t}, {n})" for a, t, n in arguments)
+        ln.append(f"kwargs = _mason_parse(sys.argv[1:], {{{spec}}})")
+        # anything unusual (`--help`, `--x=1`, bad values) goes to argparse
+        ln.append("if kwargs is None:")
+        ln.extend(_indent(line) for line in parser)
+    else:
+        ln.extend(parser)
+    ln.append("entrypoint(**kwargs)")
+
+    return ln
+
+
+def get_main_source_file(src: str, argspec: NamedTuple, fast: bool = False) -> str:
+    """Main file around `src`. With `fast`, the main block is a function
+    `_mason_main` for `MAIN_STUB` to call and `--name value` arguments skip
+    `argparse`."""
+    ln = []
+    ln.append(src)
+    ln.append(_WORKER)
+    if fast:
+        ln.append(_FAST_PARSE)
+        ln.append("def _mason_main():")
+        ln.extend(_indent(line) for line in _main_lines(argspec, fast))
+        ln.append("\n")
+        ln.append("if __name__ == '__main__':")
+        ln.append(_indent("_mason_main()"))
+    else:
+        ln.append("if __name__ == '__main__':")
+        ln.extend(_indent(line) for line in _main_lines(argspec, fast))
 
     return "\n".join(ln)
 
 
+def defer_import(statement: str) -> str:
+    """Plain `import x` or `import x.y as z` frontmatter as a lazily loaded
+    module, other statements unchanged."""
+    node = ast.parse(statement).body[0]
+    if not isinstance(node, ast.Import):
+        return statement
+    if any(a.asname is None and "." in a.name for a in node.names):
+        return statement  # `import x.y` binds `x` and needs `x.y` loaded
+
+    return "\n".join(
+        f"{a.asname or a.name} = _mason_lazy('{a.name}')" for a in node.names
+    )
+
+
+@dataclass(frozen=True)
+class FunctionTrace:
+
+    inner: str  # the function renamed, without `self` and frontmatter
+    outter: str  # frontmatter statements, to be moved to the top of `main.py`
+    # global names the function refers to, `self.x` counts as `x`
+    names: FrozenSet[str]
+    # frontmatter statement -> names it binds, empty unless a plain import
+    frontmatter: Tuple[Tuple[str, FrozenSet[str]], ...]
+    # refers to globals in ways that can not be traced, e.g. `getattr(self, x)`
+    dynamic: bool
+
+
+def _source_file(
+    method: Callable,
+) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+    """Source file of `method` and its stamp, None for both if unknown."""
+    try:
+        filename = inspect.getsourcefile(method)
+        stat = os.stat(filename)
+    except (TypeError, OSError):
+        return None, None
+    return filename, (stat.st_mtime_ns, stat.st_size)
+
+
 def get_function_source(
     method: Callable, name: Optional[str] = None
 ) -> Tuple[str, str]:
     """method or function -> inner source, outter source (to be moved to
-    frontmatter of `main.py`)"""
+    frontmatter of `main.py`)
+
+    Results are memoized per code object until its source file changes on disk.
+    """
+
+    traced = get_function_trace(method, name)
+
+    return traced.inner, traced.outter
+
+
+def get_function_trace(method: Callable, name: Optional[str] = None) -> FunctionTrace:
+    """Like `get_function_source`, with the names the function refers to."""
 
     if name is None:
         name = method.__name__
 
-    lines = inspect.getsource(method).split("\n")
-    skip_lines = 0
-    for ln in lines:
-        if ln.lstrip().startswith("def"):
-            break
-        else:
-            skip_lines += 1
-    lines = lines[skip_lines:]
-
-    # get global indent spaces
-    global_indent = len(lines[0].split("def ")[0])
-    assert global_indent % INDENT == 0, (
-        f"Method source indent ({global_indent}) is not in units of {INDENT} "
-        f"where the first line is {lines[0]}"
-    )
+    key = (method.__code__, name)
+    filename, stamp = _source_file(method)
+    cached = _source_cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    traced = _trace_function(method, name, filename, stamp)
+    _source_cache[key] = (stamp, traced)
+
+    return traced
+
+
+def reachable(
+    traces: Dict[str, FunctionTrace], root: str = "entrypoint"
+) -> Optional[Set[str]]:
+    """Names referred to from `root` and the functions of `traces` it reaches,
+    or None if one of them can not be traced."""
+    seen = {root}
+    stack = [root]
+    names = set()
+    while stack:
+        traced = traces[stack.pop()]
+        if traced.dynamic:
+            return None
+        for name in traced.names:
+            names.add(name)
+            if name in traces and name not in seen:
+                seen.add(name)
+                stack.append(name)
+
+    return names | seen
+
+
+class _Source:
+    """_Source:
+    source text addressed by the (line, utf-8 column) positions of `ast`.
+    """
 
-    global_indent = global_indent // INDENT
+    def __init__(self, text: str):
+        self.text = text
+        self.lines = text.split("\n")
+        self.starts = [0]
+        for line in self.lines:
+            self.starts.append(self.starts[-1] + len(line) + 1)
 
-    # remove global indent spaces
-    lines = (_dedent(ln, global_indent) for ln in lines[1:])
-    argspec = inspect.getfullargspec(method)
-    first_non_self_arg = 0
-    for arg in argspec.args:
-        if arg in ["self", "cls"]:
-            first_non_self_arg += 1
-            break
-    inner = [
-        f"def {name}({', '.join(argspec.args[first_non_self_arg:])}):"
-    ]  # do not include `self` or `cls` if present
-    outter = []
-    for ln in lines:
-        if ln.strip() == "":
+    def offset(self, lineno: int, col: int) -> int:
+        line = self.lines[lineno - 1]
+        return self.starts[lineno - 1] + len(line.encode("utf-8")[:col].decode("utf-8"))
+
+    def start(self, node: ast.AST) -> int:
+        return self.offset(node.lineno, node.col_offset)
+
+    def end(self, node: ast.AST) -> int:
+        return self.offset(node.end_lineno, node.end_col_offset)
+
+    def segment(self, node: ast.AST) -> str:
+        return self.text[self.start(node) : self.end(node)]
+
+
+def _header(func: ast.FunctionDef, name: str, source: _Source, skip: int) -> str:
+    """`def name(args):` without annotations and the first `skip` arguments."""
+    args = func.args
+    positional = args.posonlyargs + args.args
+    defaults = [None] * (len(positional) - len(args.defaults)) + args.defaults
+    params = []
+    for i, (arg, default) in enumerate(zip(positional, defaults)):
+        if i < skip:
             continue
-        ln = ln.rstrip()
-        if ln.endswith(_fm):
-            outter.append(ln[: -len(_fm)].strip())
-        else:
-            inner.append(ln)
+        params.append(
+            arg.arg if default is None else f"{arg.arg}={source.segment(default)}"
+        )
+        if i == len(args.posonlyargs) - 1:
+            params.append("/")
+    if args.vararg is not None:
+        params.append(f"*{args.vararg.arg}")
+    elif args.kwonlyargs:
+        params.append("*")
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        params.append(
+            arg.arg if default is None else f"{arg.arg}={source.segment(default)}"
+        )
+    if args.kwarg is not None:
+        params.append(f"**{args.kwarg.arg}")
+
+    prefix = "async def" if isinstance(func, ast.AsyncFunctionDef) else "def"
+    return f"{prefix} {name}({', '.join(params)}):"
+
+
+def _header_end(func: ast.FunctionDef, source: _Source) -> int:
+    """Offset just past the colon that ends the signature of `func`."""
+    args = func.args
+    nodes = args.posonlyargs + args.args + args.kwonlyargs + args.defaults
+    nodes += [d for d in args.kw_defaults if d is not None]
+    nodes += [a for a in (args.vararg, args.kwarg, func.returns) if a is not None]
+    pos = max((source.end(n) for n in nodes), default=source.start(func))
+    if func.returns is None:
+        pos = source.text.index(")", pos)
+
+    return source.text.index(":", pos) + 1
+
+
+def _binds(node: ast.stmt) -> FrozenSet[str]:
+    if isinstance(node, ast.Import):
+        return frozenset(a.asname or a.name.split(".")[0] for a in node.names)
+    if isinstance(node, ast.ImportFrom) and all(a.name != "*" for a in node.names):
+        return frozenset(a.asname or a.name for a in node.names)
+    return frozenset()
+
+
+def _module_functions(
+    filename: str, stamp: Tuple[int, int]
+) -> Optional[Tuple["_Source", Dict[int, List[ast.AST]]]]:
+    """Parsed source of module `filename` with its function nodes by first line
+    (of the first decorator, like `co_firstlineno`), None if it does not
+    parse."""
+    cached = _module_cache.get(filename)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], cached[2]
+
+    try:
+        with tokenize.open(filename) as f:
+            source = _Source(f.read())
+        module = ast.parse(source.text)
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError):
+        return None
+    functions: Dict[int, List[ast.AST]] = {}
+    for node in ast.walk(module):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            first = min([node.lineno] + [d.lineno for d in node.decorator_list])
+            functions.setdefault(first, []).append(node)
+    _module_cache[filename] = (stamp, source, functions)
+
+    return source, functions
+
+
+def _locate(
+    method: Callable, filename: Optional[str], stamp: Optional[Tuple[int, int]]
+) -> Tuple["_Source", ast.AST, int, int, int]:
+    """`(source, function node, start, end, indent)`: the function spans
+    `source.text[start:end]`, its lines indented by `indent` columns."""
+    code = method.__code__
+    parsed = _module_functions(filename, stamp) if filename is not None else None
+    if parsed is not None:
+        source, functions = parsed
+        for func in functions.get(code.co_firstlineno, ()):
+            if func.name == code.co_name:
+                start = source.starts[code.co_firstlineno - 1]
+                end = source.starts[func.end_lineno]
+                return source, func, start, end, func.col_offset
+
+    # source that is not a parsable file, e.g. `linecache` entries
+    lines = inspect.getsource(method).split("\n")
+    # remove the global indent of methods
+    indent = len(lines[0]) - len(lines[0].lstrip())
+    source = _Source(
+        "\n".join(ln[indent:] if ln[:indent].strip() == "" else ln for ln in lines)
+    )
+    return source, ast.parse(source.text).body[0], 0, len(source.text), 0
+
+
+def _trace_function(
+    method: Callable,
+    name: str,
+    filename: Optional[str] = None,
+    stamp: Optional[Tuple[int, int]] = None,
+) -> FunctionTrace:
+
+    source, func, region_start, region_end, indent = _locate(method, filename, stamp)
+
+    positional = func.args.posonlyargs + func.args.args
+    # do not include `self` or `cls` if present
+    self_name = None
+    if positional and positional[0].arg in ("self", "cls"):
+        self_name = positional[0].arg
+    header_end = _header_end(func, source)
+
+    # (start, end, replacement) of the function source
+    edits = [
+        (
+            region_start,
+            header_end,
+            _header(func, name, source, int(self_name is not None)),
+        )
+    ]
+
+    nodes = list(ast.walk(func))
+    # simple statements whose line ends with `# frontmatter`
+    frontmatter = []
+    removed = []
+    for node in nodes:
+        if (
+            isinstance(node, ast.stmt)
+            and not hasattr(node, "body")
+            and source.lines[node.end_lineno - 1].rstrip().endswith(_fm)
+            and node.lineno > func.lineno
+        ):
+            text = source.text[source.start(node) : source.end(node)]
+            frontmatter.append((textwrap.dedent(text).strip(), _binds(node)))
+            removed.append(node)
+    removed_ids = {id(node) for node in removed}
+    for node in nodes:
+        for block in ("body", "orelse", "finalbody"):
+            stmts = getattr(node, block, None)
+            if not isinstance(stmts, list) or not stmts:
+                continue
+            for i, stmt in enumerate(stmts):
+                if id(stmt) not in removed_ids:
+                    continue
+                start = source.starts[stmt.lineno - 1]
+                end = source.starts[stmt.end_lineno]
+                keep_block = i == 0 and all(id(s) in removed_ids for s in stmts)
+                pad = " " * stmt.col_offset + "pass\n" if keep_block else ""
+                edits.append((start, end, pad))
+    removed_spans = [(e[0], e[1]) for e in edits[1:]]
+
+    def dropped(pos: int) -> bool:
+        return pos < header_end or any(
+            start <= pos < end for start, end in removed_spans
+        )
 
+    names = set()
+    dynamic = False
+    self_bases = set()
+    for node in nodes:
+        if (
+            isinstance(node, ast.Attribute)
+            and isinstance(node.value, ast.Name)
+            and node.value.id == self_name
+        ):
+            self_bases.add(id(node.value))
+            names.add(node.attr)
+            if not dropped(source.start(node)):
+                edits.append((source.start(node), source.end(node), node.attr))
+    for node in nodes:
+        if isinstance(node, ast.Name) and id(node) not in self_bases:
+            names.add(node.id)
+            if node.id == self_name or node.id in _DYNAMIC:
+                dynamic = True
+
+    text = source.text[region_start:region_end]
+    for start, end, replacement in sorted(edits, reverse=True):
+        start, end = start - region_start, end - region_start
+        text = text[:start] + replacement + text[end:]
+
+    # remove the global indent of methods, blank lines are dropped
+    inner = [
+        (ln[indent:] if ln[:indent].strip() == "" else ln).rstrip()
+        for ln in text.split("\n")
+        if ln.strip() != ""
+    ]
     inner.append("\n")
 
-    return "\n".join(inner), "\n".join(outter)
+    return FunctionTrace(
+        "\n".join(inner),
+        "\n".join(text for text, _ in frontmatter),
+        frozenset(names),
+        tuple(frontmatter),
+        dynamic,
+    )
@@ -0,0 +1,232 @@
+import importlib
+import inspect
+import os
+import pkgutil
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+from . import trace
+from .base import Jar
+from .layers import build_layered
+
+__all__ = ["Watcher", "discover_jars", "jar_sources"]
+
+
+def _modules(name: str) -> List[Any]:
+    """Module `name`, or all modules of package `name`, imported."""
+    module = importlib.import_module(name)
+    modules = [module]
+    if hasattr(module, "__path__"):
+        for info in pkgutil.walk_packages(module.__path__, prefix=f"{name}."):
+            modules.append(importlib.import_module(info.name))
+    return modules
+
+
+def discover_jars(name: str) -> Dict[str, type]:
+    """Concrete `Jar` subclasses defined in module or package `name`, by
+    qualified name."""
+    jars = {}
+    for module in _modules(name):
+        for value in vars(module).values():
+            if (
+                inspect.isclass(value)
+                and issubclass(value, Jar)
+                and value.__module__ == module.__name__
+                and hasattr(value, "base_image")
+                and value.entrypoint is not Jar.entrypoint
+            ):
+                jars[f"{value.__module__}.{value.__qualname__}"] = value
+    return jars
+
+
+def _function(value: Any) -> Optional[Callable]:
+    if isinstance(value, trace._IncludeDecorator):
+        return value.method
+    if isinstance(value, (staticmethod, classmethod)):
+        return value.__func__
+    return value if inspect.isfunction(value) else None
+
+
+def jar_sources(jar_cls: type) -> Set[str]:
+    """Source files of the methods `jar_cls` and its jar ancestors define:
+    `setup_image`, `constants`, helpers and `entrypoint`."""
+    files = set()
+    for cls in jar_cls.__mro__:
+        if cls is Jar or not issubclass(cls, Jar):
+            continue
+        for value in vars(cls).values():
+            method = _function(value)
+            if method is None:
+                continue
+            try:
+                files.add(os.path.abspath(inspect.getsourcefile(method)))
+            except TypeError:  # built in
+                continue
+    return files
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Watcher:
+    """Watcher:
+    map the jars of module (or package) `module` to the source files their
+    methods come from, and re-save and rebuild only the jars whose files
+    changed. Files are polled every `interval` seconds, a change is acted on
+    once no file changed for `debounce` seconds.
+
+    Affected jars are rebuilt concurrently on `max_workers` threads, with
+    `layered=True` as one `build_layered` graph so shared ancestors are built
+    first and only once.
+    """
+
+    def __init__(
+        self,
+        module: str,
+        root: str = ".",
+        interval: float = 0.5,
+        debounce: float = 0.5,
+        max_workers: int = 4,
+        layered: bool = False,
+        log: Callable[[str], None] = print,
+    ):
+        self.module = module
+        self.root = root
+        self.interval = interval
+        self.debounce = debounce
+        self.max_workers = max_workers
+        self.layered = layered
+        self.log = log
+        self.discover()
+
+    def discover(self):
+        self.jars = discover_jars(self.module)
+        # jar qualified name -> source files
+        self.sources = {name: jar_sources(cls) for name, cls in self.jars.items()}
+        files = set().union(*self.sources.values())
+        self._stamps = {path: _stamp(path) for path in files}
+
+    def _current(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {path: _stamp(path) for path in self._stamps}
+
+    def changed_files(self) -> Set[str]:
+        return {
+            path
+            for path, stamp in self._current().items()
+            if stamp != self._stamps[path]
+        }
+
+    def wait_quiet(self) -> Set[str]:
+        """Wait until no watched file changed for `debounce` seconds, returns
+        the files changed since the last rebuild."""
+        current = self._current()
+        while True:
+            time.sleep(self.debounce)
+            latest = self._current()
+            if latest == current:
+                break
+            current = latest
+        return {path for path, stamp in current.items() if stamp != self._stamps[path]}
+
+    def affected(self, files: Iterable[str]) -> List[str]:
+        files = set(files)
+        return [name for name, sources in self.sources.items() if sources & files]
+
+    def _reload(self, files: Set[str], names: List[str]):
+        """Reload the modules of changed `files`, then the modules of the jars
+        `names` and of their jar bases, bases first, so subclasses re-bind to
+        the reloaded classes."""
+        by_file = {
+            os.path.abspath(module.__file__): module
+            for module in list(sys.modules.values())
+            if getattr(module, "__file__", None)
+        }
+        changed = {by_file[path].__name__ for path in files if path in by_file}
+        # module -> modules defining the jar bases of its jar classes
+        bases: Dict[str, Set[str]] = {}
+        for name in names:
+            for cls in self.jars[name].__mro__:
+                if cls is Jar or not issubclass(cls, Jar):
+                    continue
+                bases.setdefault(cls.__module__, set()).update(
+                    base.__module__
+                    for base in cls.__bases__
+                    if issubclass(base, Jar) and base is not Jar
+                )
+
+        order: List[str] = sorted(changed - set(bases))
+        seen: Set[str] = set()
+
+        def visit(module: str):
+            if module in seen:
+                return
+            seen.add(module)
+            for base in sorted(bases.get(module, ())):
+                visit(base)
+            order.append(module)
+
+        for module in sorted(bases):
+            visit(module)
+
+        jar_modules = {self.jars[name].__module__ for name in names}
+        reloaded: Set[str] = set()
+        for module in order:
+            if (
+                module in changed
+                or module in jar_modules
+                or bases.get(module, set()) & reloaded
+            ):
+                importlib.reload(sys.modules[module])
+                reloaded.add(module)
+
+    def rebuild(self, files: Set[str]) -> Dict[str, Any]:
+        """Re-save and rebuild the jars affected by `files`, returns the build
+        results by jar name."""
+        names = self.affected(files)
+        self._reload(files, names)
+        self.discover()
+        names = [name for name in names if name in self.jars]
+        jars = [self.jars[name](root=self.root) for name in names]
+        for jar in jars:
+            jar.save()
+
+        if self.layered:
+            results = build_layered(jars, self.max_workers)
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(lambda jar: jar.build(), jars))
+
+        return dict(zip(names, results))
+
+    def step(self) -> Dict[str, Any]:
+        """Rebuild what changed since the last step, if anything."""
+        if not self.changed_files():
+            return {}
+        files = self.wait_quiet()
+        for path in sorted(files):
+            self.log(f"changed: {path}")
+        try:
+            results = self.rebuild(files)
+        except Exception:
+            # e.g. a syntax error while editing, wait for the next change
+            self.log(traceback.format_exc())
+            self._stamps.update({path: _stamp(path) for path in files})
+            return {}
+        for name in results:
+            self.log(f"rebuilt: {name}")
+
+        return results
+
+    def run(self):
+        self.log(f"watching {len(self._stamps)} files of {len(self.jars)} jars")
+        while True:
+            self.step()
+            time.sleep(self.interval)
@@ -14,6 +14,8 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     install_requires=["docker"],
+    extras_require={"async": ["aiodocker"]},
+    entry_points={"console_scripts": ["mason=mason.cli:main"]},
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
@@ -0,0 +1,14 @@
+import os
+
+import pytest
+from fake_docker import FakeDockerClient
+
+import mason
+
+
+@pytest.fixture
+def fake_docker(monkeypatch):
+    cli = FakeDockerClient()
+    monkeypatch.setattr(mason.client, "_client", cli)
+    monkeypatch.setattr(mason.client, "_client_pid", os.getpid())
+    return cli
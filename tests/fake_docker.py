@@ -0,0 +1,300 @@
+"""In-process stand-in for the docker daemon, shared by tests and benchmarks."""
+
+import itertools
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import tarfile
+import threading
+
+
+def read_context(fileobj=None, path=None, dockerfile=None, **kwargs):
+    """Files of a build context as `{name: text}`, binary files as bytes."""
+    if fileobj is None:
+        with open(os.path.join(path, dockerfile or "Dockerfile")) as f:
+            return {"Dockerfile": f.read()}
+    with tarfile.open(fileobj=fileobj) as tar:
+        files = {m.name: tar.extractfile(m).read() for m in tar if m.isfile()}
+    for name, content in files.items():
+        try:
+            files[name] = content.decode()
+        except UnicodeDecodeError:
+            pass
+    fileobj.seek(0)
+    return files
+
+
+def instructions(dockerfile):
+    """Instructions of a Dockerfile, continuation lines joined."""
+    return dockerfile.replace("\\\n", "").split("\n")
+
+
+def stage_size(dockerfile, target=None):
+    """Fake image size: 1000 bytes per instruction of the `target` stage (the
+    last one by default)."""
+    stages = {}
+    name = None
+    for line in dockerfile.split("\n"):
+        if line.startswith("FROM"):
+            parts = line.split()
+            name = parts[3] if len(parts) > 3 else len(stages)
+            stages[name] = 0
+        stages[name] += 1000
+    return stages[target] if target is not None else stages[name]
+
+
+class FakeImage:
+
+    _ids = itertools.count()
+
+    def __init__(self, tag=None, labels=None, size=0, dockerfile=""):
+        self.id = f"sha256:{next(FakeImage._ids):064x}"
+        self.dockerfile = dockerfile
+        self.tags = [tag] if tag else []
+        self.labels = dict(labels or {})
+        self.attrs = {
+            "RootFS": {"Layers": ["sha256:base", f"sha256:{self.id[-12:]}"]},
+            "Size": size,
+        }
+
+    def tag(self, repository, tag=None, **kwargs):
+        self.tags.append(f"{repository}:{tag}" if tag else repository)
+        return True
+
+    def history(self):
+        """Newest first, like the classic builder: a `LABEL` entry for the build
+        labels over an entry per instruction of the last stage, 100 bytes per
+        character of `RUN`/`COPY`/`ADD` lines, over two base image layers."""
+        stage = []
+        for line in instructions(self.dockerfile):
+            stage = [] if line.startswith("FROM") else stage + [line]
+        entries = [{"CreatedBy": "/bin/sh -c #(nop)  CMD [\"bash\"]", "Size": 0}]
+        entries += [{"CreatedBy": "/bin/sh -c apt-get update", "Size": 5000}] * 2
+        for line in stage:
+            size = 100 * len(line) if line.startswith(("RUN", "COPY", "ADD")) else 0
+            if line.startswith("RUN "):
+                created_by = f"/bin/sh -c {line[4:]}"
+            else:
+                created_by = f"/bin/sh -c #(nop) {line}"
+            entries.append({"CreatedBy": created_by, "Size": size})
+        if self.labels:
+            labels = " ".join(f"{k}={v}" for k, v in self.labels.items())
+            entries.append({"CreatedBy": f"/bin/sh -c #(nop)  LABEL {labels}"})
+        return entries[::-1]
+
+
+class FakeImages:
+    def __init__(self):
+        self.store = []
+        self.built = []
+        self.pushed = []
+        self.push_failures = 0  # number of pushes to fail before succeeding
+        self.push_error = "connection reset"
+
+    def build(self, tag=None, labels=None, target=None, **kwargs):
+        context = read_context(**kwargs)
+        dockerfile = context["Dockerfile"]
+        image = FakeImage(tag, labels, stage_size(dockerfile, target), dockerfile)
+        self.store.append(image)
+        self.built.append(dict(tag=tag, labels=labels, context=context, target=target))
+        return image, [{"stream": f"Successfully tagged {tag}\n"}]
+
+    def list(self, name=None, filters=None):
+        images = self.store
+        if filters and "label" in filters:
+            key, _, value = filters["label"].partition("=")
+            images = [i for i in images if i.labels.get(key) == value]
+        return list(images)
+
+    def get(self, name):
+        for image in reversed(self.store):
+            if name in image.tags or name == image.id:
+                return image
+        raise KeyError(name)
+
+    def push(self, tag, stream=False, decode=False):
+        if self.push_failures > 0:
+            self.push_failures -= 1
+            return iter([{"error": self.push_error}])
+
+        image = self.get(f"{tag}:{tag.rsplit(':', 1)[-1]}")
+        chunks = []
+        for layer in image.attrs["RootFS"]["Layers"]:
+            layer = layer[7:19]
+            if layer in self.pushed:
+                chunks.append({"status": "Layer already exists", "id": layer})
+                continue
+            self.pushed.append(layer)
+            detail = {"current": 512, "total": 1024}
+            chunks.append({"status": "Pushing", "progressDetail": detail, "id": layer})
+            detail = {"current": 1024, "total": 1024}
+            chunks.append({"status": "Pushing", "progressDetail": detail, "id": layer})
+            chunks.append({"status": "Pushed", "progressDetail": {}, "id": layer})
+        return iter(chunks)
+
+
+class FakeSocket:
+    """Attached container stream of a local `main.py` process, multiplexed
+    like the docker daemon does."""
+
+    def __init__(self, process):
+        self.process = process
+        self.buffer = b""
+        self.timeout = None
+        self.frames = queue.Queue()
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.frames.put(struct.pack(">BxxxL", 1, len(line)) + line)
+        self.frames.put(b"")  # end of stream
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendall(self, data):
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def recv(self, size):
+        if not self.buffer:
+            try:
+                self.buffer = self.frames.get(timeout=self.timeout)
+            except queue.Empty:
+                raise socket.timeout("timed out") from None
+            if not self.buffer:
+                self.frames.put(b"")
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.process.stdin.close()
+
+
+class FakeContainer:
+    def __init__(self, command, entrypoint, hang=False):
+        self.id = "0123456789ab"
+        self.command = command
+        self.entrypoint = entrypoint
+        self.removed = False
+        self.process = None
+        self.status_code = 0
+        self.exited = threading.Event()
+        if not hang:  # otherwise runs until killed
+            self.exited.set()
+
+    def wait(self, timeout=None):
+        self.exited.wait()
+        return {"StatusCode": self.status_code}
+
+    def logs(self, stdout=True, stderr=True, **kwargs):
+        return f"ran {self.command}\n".encode() if stdout else b""
+
+    def attach(self, stream=False, demux=False, **kwargs):
+        yield f"ran {self.command}\n".encode(), None
+        yield None, "w\xc3".encode("latin-1")  # split utf-8 sequence
+        yield None, b"\xa4rning\n"
+        self.exited.wait()
+
+    def stats(self, stream=True, decode=False):
+        usage = {"usage": 2048}, {"cpu_usage": {"total_usage": 5 * 10 ** 8}}
+        return iter([dict(zip(("memory_stats", "cpu_stats"), usage))])
+
+    def kill(self):
+        self.status_code = 137
+        self.exited.set()
+
+    def attach_socket(self, params=None):
+        cmd = self.command.replace("/entrypoint", self.entrypoint).split()
+        self.process = subprocess.Popen(
+            [sys.executable] + cmd[1:], stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        return FakeSocket(self.process)
+
+    def remove(self, force=False):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+        self.removed = True
+
+
+class FakeContainers:
+    def __init__(self):
+        self.runs = []
+        self.started = []
+        self.entrypoint = "/entrypoint"  # host folder standing in for it
+        self.hang = False  # whether detached containers run until killed
+
+    def run(self, image, command=None, detach=False, **kwargs):
+        self.runs.append(dict(image=image, command=command, **kwargs))
+        if detach:
+            container = FakeContainer(command, self.entrypoint, self.hang)
+            self.started.append(container)
+            return container
+        return b"hello world\n"
+
+
+class FakeAPI:
+    def __init__(self, images):
+        self.images = images
+
+    def build(self, tag=None, labels=None, decode=False, **kwargs):
+        context = read_context(**kwargs)
+        lines = instructions(context["Dockerfile"])
+        image = FakeImage(tag, labels, dockerfile=context["Dockerfile"])
+        for i, line in enumerate(lines, 1):
+            yield {"stream": f"Step {i}/{len(lines)} : {line}\n"}
+            if line.startswith("FROM"):
+                yield {
+                    "status": "Downloading",
+                    "id": "layer",
+                    "progressDetail": {"current": 1024},
+                }
+                yield {"stream": " ---> Using cache\n"}
+            elif line.startswith("RUN"):
+                yield {"stream": " ---> Running in 0123456789ab\n"}
+            yield {"stream": f" ---> {image.id[7:19]}\n"}
+        yield {"aux": {"ID": image.id}}
+        yield {"stream": f"Successfully built {image.id[7:19]}\n"}
+        self.images.store.append(image)
+        self.images.built.append(dict(tag=tag, labels=labels, context=context))
+
+
+class FakeBuildx:
+    """Stand-in for `mason.buildkit._buildx`, building into `cli.images`."""
+
+    def __init__(self, cli):
+        self.cli = cli
+        self.calls = []
+
+    def __call__(self, args, fileobj):
+        self.calls.append(args)
+        options = dict(zip(args, args[1:]))
+        key, _, value = options["--label"].partition("=")
+        image, logs = self.cli.images.build(
+            tag=options["--tag"],
+            labels={key: value},
+            target=options.get("--target"),
+            fileobj=fileobj,
+        )
+        with open(options["--iidfile"], "w") as f:
+            f.write(image.id)
+        return [log["stream"] for log in logs]
+
+
+class FakeDockerClient:
+    """In-process stand-in for `docker.DockerClient` used by the tests."""
+
+    def __init__(self):
+        self.images = FakeImages()
+        self.containers = FakeContainers()
+        self.api = FakeAPI(self.images)
+
+    def login(self, **kwargs):
+        return {"Status": "Login Succeeded"}
+
+    def close(self):
+        self.closed = True
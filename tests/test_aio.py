@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+import mason
+
+
+class HelloWorld(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        self.RUN("python3 -m pip install numpy")
+
+    def entrypoint(self, x: int):
+        print("hello world", x)
+
+
+class FakeAsyncImages:
+    def __init__(self):
+        self.labels = {}
+        self.tags = []
+
+    async def list(self, filters=None):
+        return [{"Id": i} for i, label in self.labels.items() if label in filters]
+
+    async def tag(self, name, repo, tag=None):
+        self.tags.append((name, repo, tag))
+
+    async def build(
+        self, fileobj=None, encoding=None, tag=None, labels=None, stream=False
+    ):
+        assert encoding == "gzip" and stream
+        for chunk in (
+            {"stream": "Step 1/3 : FROM python:3.7\n"},
+            {"stream": "Step 2/3 : RUN python3 -m pip install numpy\n"},
+            {"stream": "Step 3/3 : COPY main.py /entrypoint/\n"},
+            {"aux": {"ID": "sha256:abc"}},
+        ):
+            await asyncio.sleep(0)
+            yield chunk
+        self.labels["sha256:abc"] = "=".join(*labels.items())
+
+    async def push(self, name, auth=None, stream=False):
+        self.auth = auth
+        yield {"status": "Pushing", "id": "layer", "progressDetail": {"current": 10}}
+        yield {"status": "Pushed", "id": "layer", "progressDetail": {}}
+
+
+class FakeAsyncContainer:
+    def __init__(self, config, delay):
+        self.config = config
+        self.delay = delay
+        self.deleted = False
+
+    def log(self, stdout=False, stderr=False, follow=False):
+        # like aiodocker: an async iterator when following, else an awaitable
+        return self._follow() if follow else self._logs()
+
+    async def _logs(self):
+        return []
+
+    async def _follow(self):
+        await asyncio.sleep(self.delay)
+        yield "hello world 1\n"
+
+    async def wait(self):
+        return {"StatusCode": 0}
+
+    async def delete(self, force=False):
+        self.deleted = True
+
+
+class FakeAsyncContainers:
+    def __init__(self):
+        self.started = []
+        self.delay = 0.0
+
+    async def run(self, config):
+        self.started.append(FakeAsyncContainer(config, self.delay))
+        return self.started[-1]
+
+
+class FakeAsyncDocker:
+    def __init__(self):
+        self.images = FakeAsyncImages()
+        self.containers = FakeAsyncContainers()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def _query_json(self, path, method, data=None):
+        return {"Status": "Login Succeeded"}
+
+
+@pytest.fixture
+def fake_aiodocker(monkeypatch):
+    docker = FakeAsyncDocker()
+    monkeypatch.setattr(mason.aio, "get_async_docker_client", lambda: docker)
+    return docker
+
+
+def test_abuild(fake_aiodocker):
+
+    hello = HelloWorld()
+
+    async def main():
+        op = hello.abuild()
+        events = [event async for event in op]
+        assert [
+            e.step.line for e in events if e.kind == "start"
+        ] == hello.dockerfile_lines
+        assert op.result.image == "sha256:abc"
+
+        summary = await hello.abuild()
+        assert summary.cached and summary.image == "sha256:abc"
+
+    asyncio.run(main())
+
+
+def test_arun(fake_aiodocker):
+
+    hello = HelloWorld()
+
+    async def main():
+        op = hello.arun(x=1)
+        assert [line async for line in op] == ["hello world 1\n"]
+        assert op.result.exit_code == 0 and op.result.stdout == "hello world 1\n"
+        assert fake_aiodocker.containers.started[0].config["Cmd"] == [
+            "python3",
+            "/entrypoint/main.py",
+            "--x",
+            "1",
+        ]
+
+        fake_aiodocker.containers.delay = 10
+        with pytest.raises(asyncio.TimeoutError):
+            await hello.arun(x=2).within(0.01)
+        assert fake_aiodocker.containers.started[1].deleted
+
+    asyncio.run(main())
+
+
+def test_alogin_apush(fake_aiodocker):
+
+    hello = HelloWorld()
+
+    async def main():
+        info = await hello.alogin("user", "my.registry", password="secret")
+        assert info["Status"] == "Login Succeeded"
+
+        op = hello.apush()
+        updates = [update async for update in op]
+        assert updates[-1].done == 1 and op.result.bytes == 10
+        assert fake_aiodocker.images.auth["serveraddress"] == "my.registry"
+        # credentials stay on the jar, not in module state
+        assert fake_aiodocker.images.auth["password"] == "secret"
+        assert not hasattr(mason.client, "_auth_configs")
+
+        other = HelloWorld()
+        other.registry = "my.registry"
+        await other.apush()
+        assert fake_aiodocker.images.auth is None
+
+    asyncio.run(main())
@@ -1,5 +1,12 @@
-import mason
+import os
 import tempfile
+import threading
+from typing import List
+
+import pytest
+from fake_docker import FakeBuildx
+
+import mason
 
 
 class HelloWorld(mason.Jar):
@@ -54,7 +61,23 @@ def test_save():
 
     with tempfile.TemporaryDirectory() as td:
         hello = HelloWorld(root=td)
-        hello.save()
+        report = hello.save()
+        assert report.written == ["Dockerfile", "main.py", ".dockerignore"]
+
+        mtime = os.stat(os.path.join(hello.path, "main.py")).st_mtime_ns
+        report = hello.save()
+        assert not report.changed
+        assert report.unchanged == ["Dockerfile", "main.py", ".dockerignore"]
+        assert os.stat(os.path.join(hello.path, "main.py")).st_mtime_ns == mtime
+
+        hello.a = 1
+        report = hello.save()
+        assert report.written == ["main.py"]
+        assert sorted(os.listdir(hello.path)) == [
+            ".dockerignore",
+            "Dockerfile",
+            "main.py",
+        ]
 
 
 def test_registry():
@@ -89,9 +112,505 @@ def test_helpers():
     assert "a_helper_func" in hello._helper_registry
 
 
+def test_class_template():
+
+    calls = []
+
+    class Counted(HelloConstants):
+        def setup_image(self, version: str = "1"):
+            calls.append(version)
+            self.RUN(f"echo {version}")
+
+    first, second = Counted(), Counted()
+    assert calls == ["1"]
+    assert first._path_registry is second._path_registry
+    assert first._constant_registry == second._constant_registry
+    assert first.dockerfile_lines == second.dockerfile_lines
+    assert first.dockerfile_lines is not second.dockerfile_lines
+    assert second.mainfile is first.mainfile
+
+    Counted(version="2")
+    assert calls == ["1", "2"]
+
+    # copy on write
+    first.a = 10
+    first.add_path_mirror("data", "/tmp/data", "/data")
+    first.RUN("echo extra")
+    assert second.a == second._constant_registry["a"] == 0
+    assert second._path_registry == {}
+    assert "RUN echo extra" not in second.dockerfile_lines
+    assert Counted().mainfile == second.mainfile != first.mainfile
+
+    # constants are set up per instance
+    first.d.append(99)
+    assert first._constant_registry["d"] == [0, 1, 2, 3, 99]
+    assert second.d == Counted().d == [0, 1, 2, 3]
+    assert "d = [0, 1, 2, 3, 99]" in first.mainfile
+    assert "d = [0, 1, 2, 3]" in Counted().mainfile
+
+
+def test_class_template_state():
+    class Packages(HelloConstants):
+        def setup_image(self):
+            self._packages = ["numpy"]
+            self.RUN("pip install numpy")
+
+        def constants(self):
+            self.lock = threading.Lock()
+
+    first, second = Packages(), Packages()
+    first._packages.append("scipy")
+    assert second._packages == Packages()._packages == ["numpy"]
+    assert second.lock is not first.lock
+
+    class Gpu(HelloConstants):
+        def __init__(self, gpu: bool = False, **kwargs):
+            self.gpu = gpu
+            super().__init__(**kwargs)
+
+        def setup_image(self):
+            if self.gpu:
+                self.RUN("install-cuda")
+
+    Gpu(gpu=False)
+    gpu = Gpu(gpu=True)
+    assert gpu.gpu and "RUN install-cuda" in gpu.dockerfile_lines
+
+
+def test_eliminate_dead_code():
+    class Pruned(HelloConstants):
+
+        eliminate_dead_code = True
+
+        def entrypoint(self):
+            print(self.a, self.used_helper())
+
+        @mason.include
+        def used_helper(self):
+            import os  # frontmatter
+
+            return os.sep
+
+        @mason.include
+        def unused_helper(self):
+            import sys  # frontmatter
+
+            return self.b
+
+    mainfile = Pruned().mainfile
+    assert "a = 0" in mainfile and "b = '1'" not in mainfile
+    assert "def used_helper():" in mainfile
+    assert "unused_helper" not in mainfile
+    assert mainfile.startswith("import os\n") and "\nimport sys" not in mainfile
+    assert "path_dict = {}" in mainfile
+    compile(mainfile, "main.py", "exec")
+
+
 def test_frontmatter():
 
     hello = HelloFrontmatter()
 
     assert "import os" in hello.mainfile.split("\n")[:2]
     assert "import sys" in hello.mainfile.split("\n")[:2]
+
+
+def test_build_cache(fake_docker):
+
+    hello = HelloWorld()
+    digest = hello.digest
+    assert digest == HelloWorld().digest
+    assert digest != HelloConstants().digest
+
+    image, logs = hello.build()
+    assert image.labels[mason.client.DIGEST_LABEL] == digest
+    assert len(fake_docker.images.built) == 1
+
+    cached, logs = hello.build()
+    assert cached is image and logs == []
+    assert len(fake_docker.images.built) == 1
+
+    hello.build(force=True)
+    assert len(fake_docker.images.built) == 2
+
+
+def test_mainfile_cache():
+
+    hello = HelloConstants()
+    mainfile = hello.mainfile
+    assert hello.mainfile is mainfile
+
+    hello.d.append(4)
+    assert hello.mainfile != mainfile
+    assert "d = [0, 1, 2, 3, 4]" in hello.mainfile
+
+    hello.add_path_mirror("data", eager_path="data", graph_path="/data")
+    assert "'data': '/data'" in hello.mainfile
+
+
+def test_build_stream(fake_docker):
+
+    with tempfile.TemporaryDirectory() as td:
+        hello = HelloWorld(root=td)
+
+        stream = hello.build(stream=True)
+        events = list(stream)
+        assert [e.step.number for e in events if e.kind == "start"] == [1, 2, 3]
+        assert events[0].step.line == "FROM python:3.7"
+
+        steps = stream.summary.steps
+        assert [s.line for s in steps] == hello.dockerfile_lines
+        assert steps[0].cached and not steps[1].cached
+        assert steps[0].bytes == 1024
+        assert stream.summary.slowest() == [steps[1]]
+        assert stream.summary.image.labels[mason.client.DIGEST_LABEL] == hello.digest
+
+        stream = hello.build(stream=True)
+        assert list(stream) == [] and stream.summary.cached
+
+
+class HelloMap(HelloWorld):
+    def constants(self):
+        self.offset = 1
+
+    @mason.include
+    def square(self, x):
+        return x ** 2
+
+    def entrypoint(self, x: int):
+        if x < 0:
+            raise ValueError("negative")
+        return self.square(x) + self.offset
+
+
+def test_map():
+
+    hello = HelloMap()
+    assert hello.map([dict(x=i) for i in range(4)], processes=2) == [1, 2, 5, 10]
+
+    results = hello.map([dict(x=2), dict(x=-1)], processes=1, return_exceptions=True)
+    assert results[0] == 5 and isinstance(results[1], ValueError)
+    with pytest.raises(ValueError, match="negative"):
+        hello.map([dict(x=-1)], processes=1)
+
+
+def test_run_stream(fake_docker, capsys, tmpdir):
+
+    hello = HelloMap()
+    result = hello.run(x=2)
+    out, err = capsys.readouterr()
+    assert "ran python3 /entrypoint/main.py --x 2\n" in out and err == "wärning\n"
+    assert (result.exit_code, result.stderr) == (0, "wärning\n")
+    assert result.stdout == "ran python3 /entrypoint/main.py --x 2\n"
+    assert (result.cpu_time, result.max_memory) == (0.5, 2048)
+    assert fake_docker.containers.started[-1].removed
+
+    chunks = []
+    result = hello.start(dict(x=3), output=lambda *chunk: chunks.append(chunk)).wait()
+    assert chunks == [
+        ("stdout", "ran python3 /entrypoint/main.py --x 3\n"),
+        ("stderr", "w"),
+        ("stderr", "ärning\n"),
+    ]
+    path = str(tmpdir.join("log.txt"))
+    hello.start(dict(x=4), output=path).wait()
+    assert open(path).read().startswith("ran python3")
+    assert hello.start(dict(x=5)).wait().stderr == "wärning\n"
+
+    fake_docker.containers.hang = True
+    handle = hello.start(dict(x=6))
+    with pytest.raises(TimeoutError):
+        handle.wait(timeout=0.01)
+    assert handle.running
+    handle.kill()
+    assert handle.wait().exit_code == 137
+
+    hello.run_timeout = 0.01
+    with pytest.raises(TimeoutError):
+        hello.run(x=7)
+    assert fake_docker.containers.started[-1].removed
+
+
+class HelloTable(HelloWorld):
+
+    sidecar_threshold = 1000
+
+    def constants(self):
+        self.small = [1, 2, 3]
+        self.table = list(range(1000))
+
+    def entrypoint(self, x: int):
+        return self.table[x] + self.small[0]
+
+
+def test_sidecar_constants(fake_docker, tmpdir):
+
+    hello = HelloTable(root=str(tmpdir))
+    assert "small = [1, 2, 3]" in hello.mainfile
+    assert "table = _mason_sidecar('table-" in hello.mainfile
+    assert "COPY .mason_sidecars/table-" in hello.dockerfile
+
+    # sidecars are loaded on first use
+    namespace = {"__name__": "main", "__file__": str(tmpdir.join("hellotable", "x"))}
+    exec(hello.mainfile, namespace)
+    with pytest.raises(FileNotFoundError):
+        len(namespace["table"])
+
+    folder = tmpdir.mkdir("hellotable").mkdir(".mason_sidecars")
+    folder.join("labels.json").write("{}")
+    folder.mkdir("nested")
+    report = hello.save()
+    (sidecar,) = [n for n in report.written if n.startswith(".mason_sidecars/")]
+    exec(hello.mainfile, namespace)
+    assert namespace["table"] == list(range(1000))
+    assert isinstance(namespace["table"], list)
+
+    context = hello.build_context()
+    assert sidecar in context.files
+    image, _ = hello.build()
+    assert sidecar in fake_docker.images.built[-1]["context"]
+
+    assert hello.map([dict(x=5)], processes=1) == [6]
+
+    digest = hello.digest
+    hello.table = list(range(1001))
+    assert hello.digest != digest
+    report = hello.save()
+    assert report.removed == [sidecar]
+    # files mason did not write are left alone
+    assert folder.join("labels.json").check(file=True)
+    assert folder.join("nested").check(dir=True)
+
+
+class Summarized:
+    """A value whose repr, like a DataFrame's, leaves its content out."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __repr__(self):
+        return "Summarized(" + "." * 2000 + ")"
+
+
+def test_sidecar_names(monkeypatch):
+
+    hello = HelloTable()
+    hello.table = Summarized([1, 2])
+    mainfile = hello.mainfile
+    hello.table = Summarized([1, 3])
+    assert hello.mainfile != mainfile
+    hello.table = Summarized([1, 2])
+    assert hello.mainfile == mainfile
+
+    calls = []
+    render = mason.base.render_constant
+    monkeypatch.setattr(
+        mason.base, "render_constant", lambda *a: calls.append(a) or render(*a)
+    )
+    hello.digest
+    assert len(calls) == len(hello._constant_registry)
+
+
+def test_sidecar_ndarray(tmpdir):
+
+    numpy = pytest.importorskip("numpy")
+
+    class HelloArray(HelloWorld):
+        def constants(self):
+            self.weights = numpy.arange(6.0).reshape(2, 3)
+
+    hello = HelloArray(root=str(tmpdir))
+    assert "weights = _mason_sidecar('weights-" in hello.mainfile
+    hello.save()
+    namespace = {"__name__": "main", "__file__": str(tmpdir.join("helloarray", "x"))}
+    exec(hello.mainfile, namespace)
+    assert isinstance(namespace["weights"], numpy.memmap)
+    assert (namespace["weights"] == hello.weights).all()
+
+
+class HelloFast(HelloWorld):
+
+    fast_start = True
+
+    def entrypoint(self, x: int, names: List[str]):
+        import decimal  # frontmatter
+        from os import path  # frontmatter
+
+        print(decimal.Decimal(x) + 1, names, path.sep)
+
+
+def test_fast_start(tmpdir):
+
+    import subprocess
+    import sys
+
+    hello = HelloFast(root=str(tmpdir))
+    assert hello.dockerfile_lines[-1] == "COPY main.py /entrypoint/"
+    assert hello.dockerfile.split("\n")[-2:] == [
+        "COPY main.py mason_main.py /entrypoint/",
+        "RUN python3 -m compileall -q /entrypoint",
+    ]
+    assert "decimal = _mason_lazy('decimal')" in hello.mainfile
+    assert "from os import path" in hello.mainfile
+
+    report = hello.save()
+    assert report.written[:3] == ["Dockerfile", "main.py", "mason_main.py"]
+    subprocess.run([sys.executable, "-m", "compileall", "-q", hello.path], check=True)
+
+    def run(*args):
+        return subprocess.run(
+            [sys.executable, os.path.join(hello.path, "main.py"), *args],
+            capture_output=True,
+            text=True,
+        )
+
+    assert run("--x", "2", "--names", "a", "b").stdout == "3 ['a', 'b'] /\n"
+    # anything else goes through argparse
+    assert run("--x=2", "--names", "a").stdout == "3 ['a'] /\n"
+    assert "usage:" in run("--help").stdout
+    assert run("--x", "nan?").returncode == 2
+
+
+class HelloStages(HelloWorld):
+
+    builder_image = "gcc:11"
+
+    def setup_builder(self):
+        self.COPY("src", "/src")
+        self.RUN("make -C /src", "strip /src/tool")
+
+    def setup_image(self):
+        self.copy_artifact("/src/tool", "/usr/local/bin/tool")
+
+
+def test_builder_stage(fake_docker, tmpdir):
+
+    hello = HelloStages(root=str(tmpdir))
+    tmpdir.mkdir("hellostages").mkdir("src").join("main.c").write("int main;")
+    assert hello.dockerfile.split("\n") == [
+        "FROM gcc:11 AS builder",
+        "COPY src /src",
+        "RUN make -C /src",
+        "RUN strip /src/tool",
+        "FROM python:3.7",
+        "COPY --from=builder /src/tool /usr/local/bin/tool",
+        "COPY main.py /entrypoint/",
+    ]
+    assert "src" in hello.build_context().files
+
+    report = hello.size_report()
+    assert (report.builder, report.runtime, report.saved) == (4000, 3000, 1000)
+    assert fake_docker.images.built[-1]["target"] == "builder"
+
+    with pytest.raises(ValueError):
+        hello.build(layered=True)
+    with pytest.raises(ValueError):
+        HelloWorld().size_report()
+
+
+class HelloCached(HelloWorld):
+    def setup_image(self):
+        self.RUN("python3 -m pip install numpy", cache="pip")
+
+
+def test_buildkit_cache(fake_docker, monkeypatch, tmpdir):
+
+    buildx = FakeBuildx(fake_docker)
+    monkeypatch.setattr(mason.buildkit, "_buildx", buildx)
+
+    hello = HelloCached()
+    assert hello.dockerfile_lines[1] == (
+        "RUN --mount=type=cache,target=/root/.cache/pip,sharing=locked "
+        "python3 -m pip install numpy"
+    )
+    image, logs = hello.build()
+    assert image.labels[mason.client.DIGEST_LABEL] == hello.digest
+    assert len(buildx.calls) == 1
+    with pytest.raises(ValueError):
+        hello.build(stream=True)
+    with pytest.raises(ValueError):
+        hello.abuild()
+
+    outputs = {"buildx inspect": "Name: mason\nDriver: docker-container\n"}
+    monkeypatch.setattr(
+        mason.buildkit, "_docker_output", lambda args: outputs.get(" ".join(args), "")
+    )
+    cache = str(tmpdir.mkdir("cache"))
+    HelloWorld().build(cache_from=[cache, "registry.io/hello:cache"], cache_to=cache)
+    args = buildx.calls[-1]
+    assert args[args.index("--cache-to") + 1] == f"type=local,dest={cache},mode=max"
+    assert [args[i + 1] for i, a in enumerate(args) if a == "--cache-from"] == [
+        f"type=local,src={cache}",
+        "type=registry,ref=registry.io/hello:cache",
+    ]
+
+    # the default `docker` driver exports caches only with the containerd store
+    outputs["buildx inspect"] = "Name: default\nDriver: docker\n"
+    with pytest.raises(RuntimeError, match="docker-container"):
+        HelloWorld().build(cache_to=cache, force=True)
+    HelloWorld().build(cache_from=cache, force=True)
+
+    # bare names are local directories, registry references hold a `/` or `:`
+    local = mason.buildkit._cache_option("buildcache", export=False)
+    assert local == f"type=local,src={os.path.abspath('buildcache')}"
+    remote = mason.buildkit._cache_option("localhost:5000/cache", export=False)
+    assert remote == "type=registry,ref=localhost:5000/cache"
+
+    with pytest.raises(ValueError):
+        HelloWorld().RUN("true", cache="npm")
+
+
+def test_buildkit_daemon(monkeypatch):
+
+    monkeypatch.delenv("DOCKER_HOST", raising=False)
+    assert "DOCKER_HOST" not in mason.buildkit._docker_env()
+    # the CLI talks to the daemon of `configure_docker_client`
+    monkeypatch.setitem(mason.client._client_options, "base_url", "http://ci:2375")
+    monkeypatch.setenv("DOCKER_CONTEXT", "desktop")
+    env = mason.buildkit._docker_env()
+    assert env["DOCKER_HOST"] == "tcp://ci:2375" and "DOCKER_CONTEXT" not in env
+
+
+class HelloAnalyze(HelloWorld):
+
+    optimize_layers = True
+
+    def setup_image(self):
+        super().setup_image()
+        self.RUN("apt-get install -y git")
+        self.add_tools()
+
+    def add_tools(self):
+        self.COPY("tools", "/tools")
+
+
+def test_analyze(fake_docker, tmpdir):
+
+    hello = HelloAnalyze(root=str(tmpdir))
+    tmpdir.mkdir("helloanalyze").mkdir("tools")
+    report = hello.analyze()
+    assert [(layer.line.split(" ")[0], layer.origin) for layer in report.layers] == [
+        ("RUN", "HelloWorld, HelloAnalyze"),
+        ("COPY", "HelloAnalyze"),
+        ("COPY", None),
+    ]
+    assert report.base_size == 10000
+    assert report.offenders(1) == [report.layers[0]]
+    assert report.by_origin()["HelloAnalyze"] == report.layers[1].size
+    assert report.layers[0].elapsed is not None and not report.layers[0].cached
+    assert "<<" in str(report)
+
+    report = hello.analyze()
+    assert all(layer.cached for layer in report.layers)
+    assert HelloWorld().analyze().layers[0].origin == "HelloWorld"
+
+
+def test_digest_sources(tmpdir):
+
+    hello = HelloAnalyze(root=str(tmpdir))
+    tools = tmpdir.mkdir("helloanalyze").mkdir("tools")
+    tools.join("run.sh").write("echo 1")
+    digest = hello.digest
+    assert hello.digest == digest
+
+    tools.join("run.sh").write("echo 2")
+    assert hello.digest != digest
@@ -6,3 +6,81 @@ def test_docker_client():
         mason.client.get_docker_client()
     except ImportError as e:
         print(e)
+
+
+def test_shared_client(fake_docker, monkeypatch):
+
+    assert mason.client.get_docker_client() is fake_docker
+    assert mason.Jar.docker_client() is fake_docker
+
+    mason.client.close_docker_client()
+    assert fake_docker.closed
+    assert mason.client._client is None
+
+    monkeypatch.setattr(mason.client, "_client_options", {})
+    mason.client.configure_docker_client(
+        base_url="unix://var/run/docker.sock", timeout=5
+    )
+    assert mason.client._client_options == {
+        "base_url": "unix://var/run/docker.sock",
+        "timeout": 5,
+    }
+
+
+class HelloWorld(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        self.RUN("python3 -m pip install numpy")
+
+    def entrypoint(self):
+        print("hello world")
+
+
+class HelloChild(HelloWorld):
+    def entrypoint(self):
+        print("hello child")
+
+
+def test_push_many(fake_docker):
+
+    jars = [HelloWorld(), HelloChild()]
+    for jar in jars:
+        jar.build()
+        jar.registry = "my.registry"
+
+    events = []
+    report = mason.push_many(jars, max_workers=2, progress=events.append)
+    assert not report.failed
+    assert fake_docker.images.pushed.count("base") == 1
+    assert sorted(r.skipped for r in report.results) == [0, 1]
+    assert report.bytes == 3 * 1024
+    assert events[-1].done == events[-1].layers == 2
+    assert "MB/s" in str(report)
+
+    fake_docker.images.pushed.clear()
+    fake_docker.images.push_failures = 1
+    report = mason.push_many(jars[:1], backoff=0.0, progress=None)
+    assert report.results[0].attempts == 2 and not report.failed
+
+    fake_docker.images.push_failures = 2
+    report = mason.push_many(jars[:1], retries=1, backoff=0.0, progress=None)
+    assert report.failed[0].error == "connection reset"
+
+    fake_docker.images.push_failures = 1
+    fake_docker.images.push_error = "unauthorized: authentication required"
+    report = mason.push_many(jars[:1], backoff=0.0)
+    assert report.results[0].attempts == 1
+    assert report.failed[0].error == "unauthorized: authentication required"
+
+
+def test_split_tag():
+
+    assert mason.client.split_tag("app") == ("app", None)
+    assert mason.client.split_tag("app:v1") == ("app", "v1")
+    assert mason.client.split_tag("localhost:5000/app") == ("localhost:5000/app", None)
+    assert mason.client.split_tag("localhost:5000/app:v1") == (
+        "localhost:5000/app",
+        "v1",
+    )
@@ -0,0 +1,59 @@
+import os
+import tarfile
+import tempfile
+
+import pytest
+
+import mason
+from mason.context import build_context, context_sources, dockerignore
+
+
+class HelloData(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        self.COPY("requirements.txt", "/tmp/")
+        self.ADD("https://example.com/data.tar", "/tmp/")
+        self.COPY("configs/*.yaml", "/configs/", flag="--chown=1000")
+        self.COPY("/model", "/model", flag="--from=builder")
+
+    def entrypoint(self):
+        print("hello world")
+
+
+def test_context_sources():
+
+    hello = HelloData()
+    assert context_sources(hello.dockerfile_lines) == [
+        "requirements.txt",
+        "configs/*.yaml",
+        "main.py",
+    ]
+    assert dockerignore(["main.py"]) == "*\n!Dockerfile\n!main.py\n"
+
+
+def test_build_context():
+
+    with tempfile.TemporaryDirectory() as td:
+        hello = HelloData(root=td)
+        os.makedirs(os.path.join(hello.path, "configs"))
+        os.makedirs(os.path.join(hello.path, "checkpoints"))
+        for name in ("requirements.txt", "configs/a.yaml", "checkpoints/big.bin"):
+            with open(os.path.join(hello.path, name), "w") as f:
+                f.write(name)
+
+        context = hello.build_context()
+        assert context.files == [
+            "Dockerfile",
+            "main.py",
+            "requirements.txt",
+            os.path.join("configs", "a.yaml"),
+        ]
+        with tarfile.open(fileobj=context.fileobj) as tar:
+            assert sorted(tar.getnames()) == sorted(context.files)
+        assert context.size == context.fileobj.seek(0, 2)
+
+        os.remove(os.path.join(hello.path, "requirements.txt"))
+        with pytest.raises(FileNotFoundError, match="requirements.txt"):
+            build_context(hello.path, {}, hello.dockerfile_lines)
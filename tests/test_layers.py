@@ -0,0 +1,92 @@
+import tempfile
+
+import mason
+
+
+class Base(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        self.RUN("python3 -m pip install numpy")
+
+    def entrypoint(self):
+        print("base")
+
+
+class ChildA(Base):
+    def setup_image(self):
+        super().setup_image()
+        self.RUN("python3 -m pip install scipy")
+
+
+class ChildB(Base):
+    def setup_image(self):
+        super().setup_image()
+        self.RUN("python3 -m pip install pandas")
+
+
+class Replaced(Base):
+    def setup_image(self):
+        self.RUN("apt-get update")
+
+
+def test_build_layered(fake_docker):
+
+    with tempfile.TemporaryDirectory() as td:
+        jars = [ChildA(root=td), ChildB(root=td), Replaced(root=td)]
+        results = mason.build_layered(jars, max_workers=2)
+        assert len(results) == 3
+
+        built = fake_docker.images.built
+        layers = [b for b in built if b["tag"].startswith("mason-layer-base:")]
+        assert len(layers) == 1  # shared by both children
+        assert len(built) == 4
+
+        contexts = {b["tag"]: b["context"] for b in built}
+        lines = contexts["childa"]["Dockerfile"].split("\n")
+        assert lines[0] == f"FROM {layers[0]['tag']}"
+        assert lines[1:] == [
+            "RUN python3 -m pip install scipy",
+            "COPY main.py /entrypoint/",
+        ]
+
+        # `Replaced` does not extend the setup of `Base` and is built as is
+        assert contexts["replaced"]["Dockerfile"] == jars[2].dockerfile
+
+        mason.build_layered(jars)
+        assert len(built) == 4
+
+
+class Requirements(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        self.COPY("requirements.txt", "/app/")
+
+    def entrypoint(self):
+        print("base")
+
+
+class RequirementsChild(Requirements):
+    def setup_image(self):
+        super().setup_image()
+        self.RUN("python3 -m pip install -r /app/requirements.txt")
+
+
+def test_build_layered_sources(fake_docker, tmpdir):
+
+    folder = tmpdir.mkdir("requirementschild")
+    folder.join("requirements.txt").write("numpy\n")
+    jar = RequirementsChild(root=str(tmpdir))
+    jar.build(layered=True)
+
+    # the ancestor layer reads its sources from the requesting jar's folder
+    layer = fake_docker.images.built[0]
+    assert layer["tag"].startswith("mason-layer-requirements:")
+    assert layer["context"]["requirements.txt"] == "numpy\n"
+
+    folder.join("requirements.txt").write("scipy\n")
+    jar.build(layered=True)
+    assert fake_docker.images.built[-2]["tag"] != layer["tag"]
@@ -0,0 +1,99 @@
+import mason
+from mason.optimize import CACHE_BARRIER, count_layers, optimize_dockerfile
+
+
+class HelloLayers(mason.Jar):
+
+    base_image = "ubuntu:20.04"
+    optimize_layers = True
+
+    def setup_image(self):
+        self.ENV("A=1", "B=2")
+        self.RUN("apt-get update", "apt-get install -y python3-pip")
+        self.cache_barrier()
+        self.RUN("python3 -m pip install numpy")
+        self.ENV("PATH=/opt/bin:$PATH")
+
+    def entrypoint(self):
+        print("hello world")
+
+
+def test_optimize_dockerfile():
+
+    lines = optimize_dockerfile(
+        [
+            "FROM x",
+            "RUN a",
+            "RUN b",
+            "COPY main.py /e/",
+            "RUN c",
+            CACHE_BARRIER,
+            "RUN d",
+        ],
+        keep_last=["COPY main.py /e/"],
+    )
+    assert lines == [
+        "FROM x",
+        "RUN a && \\\n    b && \\\n    c",
+        "RUN d",
+        "COPY main.py /e/",
+    ]
+
+    # exec form and flagged `RUN`s are left alone
+    lines = ['RUN ["a"]', "RUN --mount=type=cache,target=/x b", "RUN c"]
+    assert optimize_dockerfile(lines) == lines
+
+    # `ENV` reading a key set by the pending group starts a new instruction
+    lines = ["ENV A=1", "ENV B=2", "ENV C=$A", "ENV D 4"]
+    assert optimize_dockerfile(lines) == ["ENV A=1 B=2", "ENV C=$A", "ENV D 4"]
+
+
+def test_layer_report():
+
+    hello = HelloLayers()
+    report = hello.layer_report()
+    assert report.before == count_layers(hello.dockerfile_lines) == 4
+    assert report.after == 3 and report.saved == 1
+
+    lines = hello.dockerfile.split("\n")
+    assert lines[0] == "FROM ubuntu:20.04"
+    assert lines[1] == "ENV A=1 B=2"
+    assert "rm -rf /var/lib/apt/lists/*" in hello.dockerfile
+    assert "rm -rf /root/.cache/pip" in hello.dockerfile
+    assert CACHE_BARRIER not in hello.dockerfile
+    assert lines[-1] == "COPY main.py /entrypoint/"
+
+
+def test_optimize_cache_mounts():
+
+    mount = "--mount=type=cache,target=/root/.cache/pip,sharing=locked"
+    lines = optimize_dockerfile(
+        ["FROM x", "RUN a", f"RUN {mount} pip install numpy", "RUN pip install six"]
+    )
+    # the mounted cache is neither merged nor cleaned up
+    assert lines == [
+        "FROM x",
+        "RUN a",
+        f"RUN {mount} pip install numpy",
+        "RUN pip install six && \\\n    rm -rf /root/.cache/pip",
+    ]
+
+
+def test_optimize_apt_cleanup():
+
+    lines = optimize_dockerfile(
+        [
+            "FROM x",
+            "RUN apt-get update && apt-get install -y a",
+            "COPY f /f",
+            "RUN apt-get install -y b",
+        ]
+    )
+    # only the group that fetched the apt lists removes them
+    assert lines == [
+        "FROM x",
+        "RUN apt-get update && apt-get install -y a && \\\n"
+        "    rm -rf /var/lib/apt/lists/*",
+        "COPY f /f",
+        "RUN apt-get install -y b",
+    ]
@@ -1,3 +1,5 @@
+import pytest
+
 import mason
 
 
@@ -42,3 +44,46 @@ def test_mainfile():
     assert "path_dict" in hello.mainfile
 
     hello()
+
+
+class HelloMounts(HelloWorld):
+    def setup_image(self):
+        self.add_path_mirror("data", eager_path="data", graph_path="/data", mode="ro")
+        self.add_path_mirror("out", "/tmp/out", graph_path="/out", mode="rw")
+        self.add_path_mirror("scratch", eager_path="", graph_path="/tmp", mode="tmpfs")
+        self.add_path_mirror("baked", eager_path="baked", graph_path="/baked")
+
+
+def test_mounts(fake_docker, tmpdir):
+
+    # path mirrors are only mounted when asked to
+    assert HelloWorld()._run_options() == {}
+
+    hello = HelloMounts(root=str(tmpdir))
+    data = str(tmpdir.join("data"))
+    options = {
+        "volumes": {
+            data: {"bind": "/data", "mode": "ro"},
+            "/tmp/out": {"bind": "/out", "mode": "rw"},
+        },
+        "tmpfs": {"/tmp": ""},
+    }
+    assert hello._run_options() == options
+    assert mason.path.host_config(hello._run_options()) == {
+        "Binds": [f"{data}:/data:ro", "/tmp/out:/out:rw"],
+        "Tmpfs": {"/tmp": ""},
+    }
+
+    hello.run()
+    list(hello.run_many([{}, {}]))
+    for run in fake_docker.containers.runs:
+        assert run["volumes"] == options["volumes"] and run["tmpfs"] == options["tmpfs"]
+
+    # eager runs see the mounted folder, not one relative to the working directory
+    assert hello.path_dict["data"] == hello.get_eager_path("data") == data
+    assert hello.path_dict["baked"] == "baked"
+
+    with pytest.raises(ValueError):
+        hello.add_path_mirror("bad", "x", "/x", mode="rx")
+    with pytest.raises(ValueError, match="relative"):
+        hello.add_path_mirror("relative", "rel", graph_path="rel", mode="rw")
@@ -0,0 +1,107 @@
+import tempfile
+
+import pytest
+
+import mason
+
+
+class HelloSquare(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        pass
+
+    def entrypoint(self, x: int):
+        if x < 0:
+            raise ValueError("negative")
+        print(x ** 2)
+
+
+def test_container_pool(fake_docker, capsys):
+
+    with tempfile.TemporaryDirectory() as td:
+        hello = HelloSquare(root=td)
+        hello.save()
+        fake_docker.containers.entrypoint = hello.path
+
+        with hello.start_pool(size=2) as pool:
+            assert len(fake_docker.containers.started) == 2
+            assert pool.call(x=3) == {"stdout": "9\n", "stderr": ""}
+            hello.run(x=4)
+            assert "16" in capsys.readouterr().out
+            with pytest.raises(RuntimeError, match="negative"):
+                hello.run(x=-1)
+
+        assert all(c.removed for c in fake_docker.containers.started)
+        with pytest.raises(ValueError):
+            pool.call(x=1)
+
+        hello.stop_pool()
+        hello.run(x=1)
+        assert len(fake_docker.containers.runs) == 3
+
+
+def test_run_many(fake_docker):
+
+    hello = HelloSquare()
+    results = list(hello.run_many([dict(x=i) for i in range(5)], max_concurrency=2))
+    assert sorted(r.index for r in results) == list(range(5))
+    for r in results:
+        assert r.exit_code == 0 and r.stderr == ""
+        assert r.stdout == f"ran python3 /entrypoint/main.py --x {r.kwargs['x']}\n"
+    assert all(c.removed for c in fake_docker.containers.started)
+
+
+def test_run_many_pooled(fake_docker):
+
+    with tempfile.TemporaryDirectory() as td:
+        hello = HelloSquare(root=td)
+        hello.save()
+        fake_docker.containers.entrypoint = hello.path
+
+        with hello.start_pool(size=2):
+            results = {r.kwargs["x"]: r for r in hello.run_many([{"x": 2}, {"x": -2}])}
+
+        assert results[2].exit_code == 0 and results[2].stdout == "4\n"
+        assert results[-2].exit_code == 1 and "negative" in results[-2].stderr
+
+
+class Sleeper(mason.Jar):
+
+    base_image = "python:3.7"
+    run_timeout = 1.0
+
+    def setup_image(self):
+        pass
+
+    def entrypoint(self, seconds: float):
+        import os
+        import time
+
+        if seconds < 0:
+            os._exit(1)
+        time.sleep(seconds)
+        print("awake")
+
+
+def test_container_pool_replaces_workers(fake_docker, capsys):
+
+    with tempfile.TemporaryDirectory() as td:
+        sleeper = Sleeper(root=td)
+        sleeper.save()
+        fake_docker.containers.entrypoint = sleeper.path
+
+        with sleeper.start_pool(size=1):
+            with pytest.raises(TimeoutError):
+                sleeper.run(seconds=30)
+            with pytest.raises(RuntimeError, match="exited"):
+                sleeper.run(seconds=-1)
+
+            # both broken workers were removed and replaced by fresh ones
+            started = fake_docker.containers.started
+            assert len(started) == 3
+            assert started[0].removed and started[1].removed
+            assert sleeper.run(seconds=0).stdout == "awake\n"
+
+        assert all(c.removed for c in fake_docker.containers.started)
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+import mason
+from mason import spans
+
+
+class HelloWorld(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        self.RUN("python3 -m pip install numpy")
+
+    def constants(self):
+        self.x = 1
+
+    def entrypoint(self, x: int):
+        print("hello world", x)
+
+
+@pytest.fixture
+def tracing():
+    spans.clear_spans()
+    spans.enable_tracing()
+    yield
+    spans.disable_tracing()
+    spans.clear_spans()
+
+
+def test_disabled_records_nothing():
+
+    spans.clear_spans()
+    with spans.span("noop") as s:
+        s.set(a=1)
+    HelloWorld().mainfile
+    assert spans.get_spans() == []
+
+
+def test_lifecycle_spans(tracing, fake_docker, tmpdir):
+
+    hello = HelloWorld(root=str(tmpdir))
+    hello.mainfile
+    hello.mainfile
+    hello.save()
+    hello.build()
+    hello.build()
+
+    by_name = {}
+    for s in spans.get_spans():
+        by_name.setdefault(s.name, []).append(s)
+
+    init = by_name["init"][0]
+    for phase in ("setup_image", "constants"):
+        assert by_name[phase][0].parent_id == init.span_id
+    assert init.attributes["jar"] == "HelloWorld"
+    assert init.attributes["tag"] == "helloworld"
+
+    assert [s.attributes["cache_hit"] for s in by_name["mainfile"]][:2] == [
+        False,
+        True,
+    ]
+    assert by_name["save"][0].attributes["written"] == 3
+
+    first, second = by_name["build"]
+    assert first.attributes["bytes_sent"] > 0
+    assert not first.attributes["cache_hit"] and second.attributes["cache_hit"]
+    context = by_name["build_context"][0]
+    assert context.parent_id == first.span_id
+
+
+def test_hooks_and_export(tracing, tmpdir):
+
+    ended = []
+    spans.add_span_hook(ended.append)
+    try:
+        with spans.span("outer", a=1):
+            with pytest.raises(KeyError):
+                with spans.span("inner"):
+                    raise KeyError()
+    finally:
+        spans.remove_span_hook(ended.append)
+
+    inner, outer = ended
+    assert inner.parent_id == outer.span_id
+    assert inner.attributes["error"] == "KeyError"
+
+    path = str(tmpdir.join("spans.jsonl"))
+    spans.export_jsonl(path)
+    with open(path) as f:
+        rows = [json.loads(line) for line in f]
+    assert [r["name"] for r in rows] == ["inner", "outer"]
+    assert rows[1]["attributes"] == {"a": 1}
+
+    path = str(tmpdir.join("trace.json"))
+    spans.export_chrome_trace(path)
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+    assert [e["ph"] for e in events] == ["X", "X"]
+    assert events[1]["dur"] >= events[0]["dur"]
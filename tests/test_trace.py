@@ -87,3 +87,77 @@ def test_outter_source():
     assert ex_method == "import math"
     assert ex_static_method == "import math"
     assert ex_class_method == "import math"
+
+
+def test_source_cache(tmp_path):
+
+    import importlib.util
+    import os
+
+    path = tmp_path / "example_module.py"
+    path.write_text("def f(a):\n    return a\n\n\ndef g(a):\n    return f(a)\n")
+    spec = importlib.util.spec_from_file_location("example_module", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    source = trace.get_function_source(module.f)
+    assert trace.get_function_source(module.f) == source
+    assert (module.f.__code__, "f") in trace._source_cache
+    # the module is parsed once for all of its functions
+    parsed = trace._module_cache[str(path)]
+    assert trace.get_function_source(module.g)[0] == "def g(a):\n    return f(a)\n\n"
+    assert trace._module_cache[str(path)] is parsed
+
+    path.write_text("def f(a):\n    return a + 1\n")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    assert "return a + 1" in trace.get_function_source(module.f)[0]
+
+
+def test_trace_rewrites_self():
+    class Example:
+        def method(self, a, b: int = 2, *args, c=None, **kwargs) -> int:
+            import os  # frontmatter
+
+            print("self.a stays", self.helper(a), self.scale)
+            if a:
+                import sys  # frontmatter
+
+    traced = trace.get_function_trace(Example().method, "renamed")
+    lines = traced.inner.rstrip("\n").split("\n")
+    assert lines[0] == "def renamed(a, b=2, *args, c=None, **kwargs):"
+    assert lines[1].strip() == 'print("self.a stays", helper(a), scale)'
+    assert lines[3].strip() == "pass"
+    assert traced.outter == "import os\nimport sys"
+    assert {"helper", "scale", "print"} <= traced.names
+    assert not traced.dynamic
+
+    compile(traced.inner, "main.py", "exec")
+
+
+def test_reachable():
+    class Example:
+        def entrypoint(self):
+            self.used(1)
+
+        def used(self, x):
+            return x + self.constant
+
+        def unused(self):
+            pass
+
+        def dynamic(self):
+            return getattr(self, "constant")
+
+    ex = Example()
+    traces = {
+        name: trace.get_function_trace(getattr(ex, name))
+        for name in ("entrypoint", "used", "unused")
+    }
+    names = trace.reachable(traces)
+    assert {"entrypoint", "used", "constant"} <= names
+    assert "unused" not in names
+
+    traces["used"] = trace.get_function_trace(ex.dynamic, "used")
+    assert trace.reachable(traces) is None
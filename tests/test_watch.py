@@ -0,0 +1,121 @@
+import sys
+import textwrap
+
+import pytest
+
+from mason.watch import Watcher, discover_jars
+
+BASE = """
+import mason
+
+
+class Base(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        self.RUN("echo base {offset}")
+
+    @mason.include
+    def helper(self, x):
+        return x + {offset}
+"""
+
+JARS = """
+import mason
+
+from .base import Base
+
+
+class Child(Base):
+    def entrypoint(self, x: int):
+        print(self.helper(x))
+
+
+class Other(mason.Jar):
+
+    base_image = "python:3.7"
+
+    def setup_image(self):
+        pass
+
+    def entrypoint(self, x: int):
+        print(x)
+"""
+
+
+@pytest.fixture
+def package(tmpdir, monkeypatch):
+    pkg = tmpdir.mkdir("watched")
+    pkg.join("__init__.py").write("")
+    pkg.join("base.py").write(textwrap.dedent(BASE.format(offset=1)))
+    pkg.join("jars.py").write(textwrap.dedent(JARS))
+    monkeypatch.syspath_prepend(str(tmpdir))
+    yield pkg
+    for name in [m for m in sys.modules if m.startswith("watched")]:
+        del sys.modules[name]
+
+
+def test_discover(package):
+
+    jars = discover_jars("watched")
+    assert sorted(jars) == ["watched.jars.Child", "watched.jars.Other"]
+
+
+def test_rebuild_affected(package, fake_docker, tmpdir):
+
+    watcher = Watcher("watched", root=str(tmpdir), debounce=0.01, log=lambda _: None)
+    assert str(package.join("base.py")) in watcher.sources["watched.jars.Child"]
+    assert str(package.join("base.py")) not in watcher.sources["watched.jars.Other"]
+    assert watcher.step() == {}
+
+    package.join("base.py").write(textwrap.dedent(BASE.format(offset=100)))
+    results = watcher.step()
+    assert list(results) == ["watched.jars.Child"]
+    assert len(fake_docker.images.built) == 1
+    assert "return x + 100" in tmpdir.join("child", "main.py").read()
+
+    # broken edits are reported and skipped
+    package.join("jars.py").write("class Broken(")
+    logs = []
+    watcher.log = logs.append
+    assert watcher.step() == {}
+    assert any("SyntaxError" in line for line in logs)
+    assert watcher.step() == {}
+
+
+MID = """
+from .base import Base
+
+
+class Mid(Base):
+    def setup_image(self):
+        super().setup_image()
+        self.RUN("echo mid")
+"""
+
+LEAF = """
+from .mid import Mid
+
+
+class Leaf(Mid):
+    def entrypoint(self, x: int):
+        print(self.helper(x) * {scale})
+"""
+
+
+def test_rebuild_reload_order(package, fake_docker, tmpdir):
+
+    # `alpha.py` sorts before the `base.py` its jar extends through `mid.py`
+    package.join("mid.py").write(textwrap.dedent(MID))
+    package.join("alpha.py").write(textwrap.dedent(LEAF.format(scale=1)))
+    watcher = Watcher("watched", root=str(tmpdir), debounce=0.01, log=lambda _: None)
+
+    package.join("base.py").write(textwrap.dedent(BASE.format(offset=100)))
+    package.join("alpha.py").write(textwrap.dedent(LEAF.format(scale=2)))
+    results = watcher.step()
+    assert sorted(results) == ["watched.alpha.Leaf", "watched.jars.Child"]
+    mainfile = tmpdir.join("leaf", "main.py").read()
+    assert "return x + 100" in mainfile and "* 2" in mainfile
+    dockerfile = tmpdir.join("leaf", "Dockerfile").read()
+    assert "RUN echo base 100\nRUN echo mid" in dockerfile